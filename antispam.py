@@ -0,0 +1,108 @@
+from array import array
+from collections import OrderedDict
+
+# Sliding-window flood detection for on_message.
+#
+# Every tracked user and channel keeps a fixed-size ring buffer of its most
+# recent message times. "N messages within W seconds" is then a single
+# comparison against the timestamp N slots back, so a check costs the same no
+# matter how busy the channel is. Entries live in OrderedDicts ordered by last
+# activity; idle ones are dropped from the front as new messages arrive.
+#
+# Optionally (channel_limit > 0), while a channel is flooding (many users at
+# once, e.g. a raid), the per-user limit is halved for everyone posting in it.
+
+MAX_TRACKED_USERS = 50000
+MAX_TRACKED_CHANNELS = 5000
+
+
+class _Window:
+    __slots__ = ("times", "head", "last")
+
+    def __init__(self, size: int):
+        self.times = array("d", [float("-inf")]) * size
+        self.head = 0
+        self.last = float("-inf")
+
+    def add(self, now: float):
+        self.times[self.head] = now
+        self.head = (self.head + 1) % len(self.times)
+        self.last = now
+
+    def span(self, n: int):
+        # Seconds covered by the last n entries (inf until there have been n)
+        return self.last - self.times[(self.head - n) % len(self.times)]
+
+    def reset(self):
+        for i in range(len(self.times)):
+            self.times[i] = float("-inf")
+
+
+class _UserWindow(_Window):
+    __slots__ = ("messages",)
+
+    def __init__(self, size: int):
+        super().__init__(size)
+        self.messages = [None] * size  # (channel_id, message_id), parallel to times
+
+    def add_message(self, now: float, channel_id: int, message_id: int):
+        self.messages[self.head] = (channel_id, message_id)
+        self.add(now)
+
+    def recent_messages(self):
+        return [m for m in self.messages if m is not None]
+
+    def reset(self):
+        super().reset()
+        self.messages = [None] * len(self.messages)
+
+
+class _ChannelWindow(_Window):
+    __slots__ = ("flood_until",)
+
+    def __init__(self, size: int):
+        super().__init__(size)
+        self.flood_until = float("-inf")
+
+
+class SpamFilter:
+    def __init__(self, user_limit: int, channel_limit: int, window: float):
+        self.user_limit = user_limit
+        self.channel_limit = channel_limit
+        self.window = window
+        self.users = OrderedDict()     # (guild_id, user_id) -> _UserWindow
+        self.channels = OrderedDict()  # channel_id -> _ChannelWindow
+        self.triggered = 0
+
+    def _touch(self, table, key, factory, now: float, max_size: int):
+        # Front of the table is the least recently active entry
+        idle_before = now - self.window
+        while table and (len(table) >= max_size or next(iter(table.values())).last < idle_before):
+            table.popitem(last=False)
+        entry = table.get(key)
+        if entry is None:
+            entry = table[key] = factory()
+        else:
+            table.move_to_end(key)
+        return entry
+
+    def check(self, guild_id: int, channel_id: int, user_id: int, message_id: int, now: float):
+        # Records one message; returns the user's recent (channel_id, message_id)
+        # pairs if this message crossed the limit, otherwise None
+        limit = self.user_limit
+        if self.channel_limit:
+            channel = self._touch(self.channels, channel_id, lambda: _ChannelWindow(self.channel_limit), now, MAX_TRACKED_CHANNELS)
+            channel.add(now)
+            if channel.span(self.channel_limit) <= self.window:
+                channel.flood_until = now + self.window
+            if now <= channel.flood_until:
+                limit = max(2, self.user_limit // 2)
+
+        user = self._touch(self.users, (guild_id, user_id), lambda: _UserWindow(self.user_limit), now, MAX_TRACKED_USERS)
+        user.add_message(now, channel_id, message_id)
+        if user.span(limit) > self.window:
+            return None
+        self.triggered += 1
+        messages = user.recent_messages()
+        user.reset()  # Start over so the follow-up messages don't re-trigger
+        return messages
@@ -0,0 +1,239 @@
+"""Offline load test for the bot's event and slash command handlers.
+
+Imports offline_bot without connecting to Discord, then replays a synthetic
+traffic mix through on_message and the slash command callbacks using the
+stand-ins in fakes.py. Reports events/sec, p50/p99 handler latency per event
+type, REST calls issued and memory allocated.
+
+    python benchmarks/bench_handlers.py --events 20000 --members 5000
+    python benchmarks/bench_handlers.py --mix message=90,kick=5,sleeping=5 --rest-latency 50
+    python benchmarks/bench_handlers.py --mix message=80,spam=20
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# Keep benchmark state out of the real state directory
+os.environ.setdefault("STATE_DIR", tempfile.mkdtemp(prefix="bench-state-"))
+
+import offline_bot  # noqa: E402
+from fakes import FakeChannel, FakeGuild, FakeHTTP, FakeInteraction, FakeMember, FakeMessage, FakeUser  # noqa: E402
+
+DEFAULT_MIX = (
+    "message=70,spam=2,sleep=8,kick=2,ban=1,unban=1,mute=3,unmute=1,promote=2,demote=2,record=3,print=3,repeat=1,"
+    "stop=1,refresh=1,sleeping=3,masskick=1,massban=1,massmute=1,masspromote=1,massdemote=1,allowchannel=1,access=1,"
+    "server_rules=1,about=1,stats=1,cases=2"
+)
+
+
+def parse_mix(text: str):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+class Scenario:
+    def __init__(self, args):
+        self.rng = random.Random(args.seed)
+        self.http = FakeHTTP(latency=args.rest_latency / 1000)
+        self.guild = FakeGuild(self.http, offline_bot.ROLES_HIERARCHY, args.members, seed=args.seed)
+        self.channels = [FakeChannel(self.guild) for _ in range(args.channels)]
+        members = self.guild.members
+        self.members = members
+        self.staff = [m for m in members if offline_bot.get_member_role_rank(m) <= offline_bot.ADMIN_RANK]
+        if not self.staff:
+            raise SystemExit("No admin-ranked members generated; raise --members")
+        self.spammers = [m for m in members if m not in self.staff][:3]
+        # Owner-only commands check the configured OWNER_ID
+        self.owner = FakeMember(self.guild, "owner", [])
+        self.owner.id = offline_bot.OWNER_ID
+        if offline_bot.spam_filter is not None:
+            offline_bot.spam_filter.window = args.spam_window
+        offline_bot.bot._connection.user = FakeUser(name="Akane")
+
+    def interaction(self, command, user=None):
+        return FakeInteraction(command, user or self.rng.choice(self.staff), self.rng.choice(self.channels))
+
+    def target(self):
+        return self.rng.choice(self.members)
+
+    # Each event returns the coroutine to time
+
+    def message(self):
+        author = self.target()
+        return offline_bot.on_message(FakeMessage(self.rng.choice(self.channels), author, "hello there", offline_bot.bot._connection))
+
+    def spam(self):
+        # A few members flooding one channel, to exercise the anti-spam stage
+        author = self.rng.choice(self.spammers)
+        return offline_bot.on_message(FakeMessage(self.channels[0], author, "buy now", offline_bot.bot._connection))
+
+    def sleep(self):
+        return offline_bot.sleep_cmd.callback(self.interaction("sleep", self.target()))
+
+    def kick(self):
+        return offline_bot.kick.callback(self.interaction("kick"), self.target(), "bench")
+
+    def ban(self):
+        return offline_bot.ban.callback(self.interaction("ban"), self.target(), "bench")
+
+    def mute(self):
+        return offline_bot.mute.callback(self.interaction("mute"), self.target(), 10, "bench")
+
+    def unmute(self):
+        return offline_bot.unmute.callback(self.interaction("unmute"), self.target())
+
+    def promote(self):
+        return offline_bot.promote.callback(self.interaction("promote"), self.target())
+
+    def demote(self):
+        return offline_bot.demote.callback(self.interaction("demote"), self.target())
+
+    def record(self):
+        return offline_bot.record_cmd.callback(self.interaction("record"), "bench record", "channel")
+
+    def print(self):
+        return offline_bot.print_cmd.callback(self.interaction("print"))
+
+    def repeat(self):
+        return offline_bot.repeat_cmd.callback(self.interaction("repeat"), 5, 0)
+
+    def sleeping(self):
+        return offline_bot.sleeping_cmd.callback(self.interaction("sleeping"))
+
+    def unban(self):
+        return offline_bot.unban.callback(self.interaction("unban"), FakeUser(name="banned", bot=False))
+
+    def stop(self):
+        return offline_bot.stop_cmd.callback(self.interaction("stop"), self.rng.random() < 0.2)
+
+    def refresh(self):
+        return offline_bot.refresh_cmd.callback(self.interaction("refresh"), self.rng.choice(("channel", "server")))
+
+    def target_ids(self, count=20):
+        return " ".join(str(self.target().id) for _ in range(count))
+
+    def masskick(self):
+        return offline_bot.masskick.callback(self.interaction("masskick"), self.target_ids(), 0, 0, "bench")
+
+    def massban(self):
+        return offline_bot.massban.callback(self.interaction("massban"), self.target_ids(), 0, 0, "bench")
+
+    def massmute(self):
+        return offline_bot.massmute.callback(self.interaction("massmute"), 10, self.target_ids(), 0, 0, "bench")
+
+    def masspromote(self):
+        return offline_bot.masspromote.callback(self.interaction("masspromote"), self.target_ids())
+
+    def massdemote(self):
+        return offline_bot.massdemote.callback(self.interaction("massdemote"), self.target_ids())
+
+    def allowchannel(self):
+        return offline_bot.allowchannel_cmd.callback(self.interaction("allowchannel", self.owner))
+
+    def access(self):
+        return offline_bot.access_cmd.callback(self.interaction("access", self.owner), str(self.guild.id))
+
+    def server_rules(self):
+        return offline_bot.server_rules_cmd.callback(self.interaction("server_rules"))
+
+    def about(self):
+        return offline_bot.about_cmd.callback(self.interaction("about", self.target()))
+
+    def stats(self):
+        return offline_bot.stats_cmd.callback(self.interaction("stats", self.owner))
+
+    def cases(self):
+        return offline_bot.cases_cmd.callback(self.interaction("cases"), self.target(), None, None, None)
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+async def run(args):
+    scenario = Scenario(args)
+    mix = parse_mix(args.mix)
+    for name in mix:
+        if not hasattr(scenario, name):
+            raise SystemExit(f"Unknown event type in mix: {name}")
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    plan = scenario.rng.choices(names, weights=weights, k=args.events)
+    latencies = defaultdict(list)
+
+    async def timed(name):
+        coro = getattr(scenario, name)()
+        started = time.perf_counter()
+        try:
+            await coro
+        except Exception as e:
+            latencies[f"{name} (error: {type(e).__name__})"].append(time.perf_counter() - started)
+            return
+        latencies[name].append(time.perf_counter() - started)
+
+    if args.trace_alloc:
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+
+    started = time.perf_counter()
+    for i in range(0, len(plan), args.concurrency):
+        await asyncio.gather(*(timed(name) for name in plan[i:i + args.concurrency]))
+    elapsed = time.perf_counter() - started
+
+    if args.trace_alloc:
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        diff = after.compare_to(before, "filename")
+        net_bytes = sum(stat.size_diff for stat in diff)
+        net_blocks = sum(stat.count_diff for stat in diff)
+
+    # Let the outbound scheduler drain so its sends are counted
+    while offline_bot.outbound.pending():
+        await asyncio.sleep(0.1)
+
+    print(f"{args.events} events in {elapsed:.3f}s -> {args.events / elapsed:,.0f} events/sec "
+          f"({args.members} members, {args.channels} channels, concurrency {args.concurrency})")
+    print(f"{'event':<28}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name in sorted(latencies, key=lambda n: -len(latencies[n])):
+        values = sorted(latencies[name])
+        print(f"{name:<28}{len(values):>8}{percentile(values, 0.5) * 1000:>10.3f}"
+              f"{percentile(values, 0.99) * 1000:>10.3f}{values[-1] * 1000:>10.3f}")
+    print("REST calls: " + ", ".join(f"{route}={n}" for route, n in scenario.http.calls.most_common()))
+    if args.trace_alloc:
+        print(f"Allocations: peak {peak / 1024:,.0f} KiB, net {net_bytes / 1024:,.0f} KiB "
+              f"in {net_blocks:,} blocks ({net_blocks / args.events:.1f} blocks/event)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--members", type=int, default=2000)
+    parser.add_argument("--channels", type=int, default=20)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Comma-separated event=weight pairs")
+    parser.add_argument("--concurrency", type=int, default=1, help="Events dispatched at once")
+    parser.add_argument("--rest-latency", type=float, default=0.0, help="Simulated REST latency in ms")
+    parser.add_argument("--spam-window", type=float, default=0.01,
+                        help="Anti-spam window in seconds; replay runs far faster than real chat, so keep it short")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--trace-alloc", action="store_true", help="Measure allocations with tracemalloc (slower)")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Member cache memory: default chunked cache vs LOW_MEMORY mode.
+
+Builds a guild with real discord.Member objects and measures, with
+tracemalloc, what stays resident after every member has been seen once:
+
+  default     every member is cached, as after startup chunking
+  low-memory  offline_bot.remember_member decides: staff and sleepers are
+              pinned in the guild cache, everyone else goes through the LRU
+
+    python benchmarks/bench_memory.py --members 50000
+"""
+
+import argparse
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("STATE_DIR", tempfile.mkdtemp(prefix="bench-state-"))
+
+import discord  # noqa: E402
+
+import offline_bot  # noqa: E402
+
+GUILD_ID = 4242
+
+
+def make_guild(state, role_names, member_count):
+    roles = [{"id": str(GUILD_ID), "name": "@everyone", "permissions": "0", "position": 0}]
+    for position, name in enumerate(reversed(role_names), start=1):
+        roles.append({"id": str(1000 + position), "name": name, "permissions": "0", "position": position})
+    for i in range(20):
+        roles.append({"id": str(2000 + i), "name": f"cosmetic {i}", "permissions": "0", "position": len(roles)})
+    data = {"id": str(GUILD_ID), "name": "bench guild", "roles": roles, "member_count": member_count, "owner_id": "1"}
+    return discord.Guild(data=data, state=state)
+
+
+def member_payloads(args):
+    rng = random.Random(args.seed)
+    staff_roles = [str(1001 + i) for i in range(len(offline_bot.ROLES_HIERARCHY))]
+    cosmetic = [str(2000 + i) for i in range(20)]
+    for i in range(args.members):
+        roles = rng.sample(cosmetic, 3)
+        if rng.random() < args.staff_ratio:
+            roles.append(rng.choice(staff_roles))
+        yield {
+            "user": {"id": str(10**17 + i), "username": f"member{i}", "discriminator": "0", "avatar": None, "global_name": f"Member {i}"},
+            "roles": roles,
+            "joined_at": "2024-01-01T00:00:00+00:00",
+            "nick": None,
+            "deaf": False,
+            "mute": False,
+            "flags": 0,
+        }
+
+
+def measure(mode, args):
+    state = offline_bot.bot._connection
+    offline_bot.LOW_MEMORY = mode == "low-memory"
+    offline_bot.member_lru.members.clear()
+    offline_bot.guild_role_ranks.pop(GUILD_ID, None)
+    offline_bot.sleep_start_times.clear()
+    rng = random.Random(args.seed + 1)
+
+    gc.collect()
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    started = time.perf_counter()
+
+    guild = make_guild(state, offline_bot.ROLES_HIERARCHY, args.members)
+    for payload in member_payloads(args):
+        member = discord.Member(data=payload, guild=guild, state=state)
+        if offline_bot.LOW_MEMORY:
+            if rng.random() < args.sleep_ratio:
+                offline_bot.sleep_start_times.setdefault(GUILD_ID, {})[member.id] = None
+            offline_bot.remember_member(member)
+        else:
+            guild._add_member(member)
+    del member
+
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    cached = len(guild._members)
+    lru = len(offline_bot.member_lru.members) if offline_bot.LOW_MEMORY else 0
+    resident = current - baseline
+    print(f"{mode:<12}{resident / 1024:>12,.0f}{peak / 1024:>12,.0f}{resident / args.members:>10,.0f}"
+          f"{cached:>10,}{lru:>8,}{elapsed:>9.2f}s")
+    return guild
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=20000)
+    parser.add_argument("--staff-ratio", type=float, default=0.02)
+    parser.add_argument("--sleep-ratio", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{args.members:,} members, LRU size {offline_bot.MEMBER_LRU_SIZE}")
+    print(f"{'mode':<12}{'KiB held':>12}{'KiB peak':>12}{'B/member':>10}{'cached':>10}{'lru':>8}{'build':>10}")
+    for mode in ("default", "low-memory"):
+        guild = measure(mode, args)
+        del guild
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+import asyncio
+import itertools
+import random
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+# Local stand-ins for the gateway and HTTP layer.
+#
+# The objects below expose just the attributes and coroutines the handlers in
+# offline_bot.py touch. Every coroutine that would be a REST call in
+# discord.py goes through FakeHTTP, which counts it and optionally sleeps to
+# simulate API latency.
+
+_ids = itertools.count(10**17)
+
+
+def next_id():
+    return next(_ids)
+
+
+class FakeHTTP:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = Counter()
+
+    async def call(self, route: str):
+        self.calls[route] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+
+class FakeUser:
+    def __init__(self, user_id=None, name="bot", bot=True):
+        self.id = user_id or next_id()
+        self.name = name
+        self.bot = bot
+        self.mention = f"<@{self.id}>"
+
+    def __str__(self):
+        return self.name
+
+
+class FakeRole:
+    def __init__(self, guild, name: str, position: int):
+        self.guild = guild
+        self.id = next_id()
+        self.name = name
+        self.position = position
+
+    def is_default(self):
+        return self.position == 0
+
+
+class FakeMember:
+    def __init__(self, guild, name: str, roles, joined_minutes_ago=60 * 24 * 30, account_days=365):
+        now = datetime.now(timezone.utc)
+        self.guild = guild
+        self.id = next_id()
+        self.name = name
+        self.bot = False
+        self.mention = f"<@{self.id}>"
+        self.roles = [guild.default_role] + list(roles)
+        self.joined_at = now - timedelta(minutes=joined_minutes_ago)
+        self.created_at = now - timedelta(days=account_days)
+
+    def __str__(self):
+        return self.name
+
+    async def kick(self, reason=None):
+        await self.guild.http.call("kick")
+
+    async def ban(self, reason=None):
+        await self.guild.http.call("ban")
+
+    async def timeout(self, until, reason=None):
+        await self.guild.http.call("timeout")
+
+    async def edit(self, roles=None, reason=None):
+        await self.guild.http.call("edit_member")
+        if roles is not None:
+            self.roles = [self.guild.default_role] + [r for r in roles if not r.is_default()]
+
+
+class FakeBulkBanResult:
+    def __init__(self, banned, failed):
+        self.banned = banned
+        self.failed = failed
+
+
+class FakeGuild:
+    def __init__(self, http: FakeHTTP, role_names, member_count: int, staff_ratio: float = 0.02, seed: int = 0):
+        rng = random.Random(seed)
+        self.http = http
+        self.id = next_id()
+        self.name = "bench guild"
+        self.default_role = FakeRole(self, "@everyone", 0)
+        self.roles = [self.default_role]
+        for position, name in enumerate(reversed(role_names), start=1):
+            self.roles.append(FakeRole(self, name, position))
+        for i in range(20):
+            self.roles.append(FakeRole(self, f"cosmetic {i}", len(self.roles)))
+        staff_roles = self.roles[1:len(role_names) + 1]
+        cosmetic = self.roles[len(role_names) + 1:]
+        self._members = {}
+        self._channels = {}
+        for i in range(member_count):
+            roles = rng.sample(cosmetic, 3)
+            if rng.random() < staff_ratio:
+                roles.append(rng.choice(staff_roles))
+            member = FakeMember(self, f"member{i}", roles, joined_minutes_ago=rng.randint(1, 60 * 24 * 365), account_days=rng.randint(1, 3000))
+            self._members[member.id] = member
+        self.owner_id = next(iter(self._members))
+        self._roles_by_id = {role.id: role for role in self.roles}
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    def get_member(self, user_id):
+        return self._members.get(user_id)
+
+    def get_role(self, role_id):
+        return self._roles_by_id.get(role_id)
+
+    def get_channel_or_thread(self, channel_id):
+        return self._channels.get(channel_id)
+
+    async def fetch_member(self, user_id):
+        await self.http.call("fetch_member")
+        return self._members[user_id]
+
+    async def kick(self, user, reason=None):
+        await self.http.call("kick")
+
+    async def ban(self, user, reason=None):
+        await self.http.call("ban")
+
+    async def unban(self, user, reason=None):
+        await self.http.call("unban")
+
+    async def bulk_ban(self, users, reason=None, delete_message_seconds=86400):
+        await self.http.call("bulk_ban")
+        return FakeBulkBanResult(list(users), [])
+
+
+class FakeSentMessage:
+    def __init__(self, channel, content):
+        self.channel = channel
+        self.id = next_id()
+        self.content = content
+
+    async def edit(self, content=None, **kwargs):
+        await self.channel.http.call("edit_message")
+        self.content = content
+
+
+class FakeChannel:
+    def __init__(self, guild: FakeGuild):
+        self.guild = guild
+        self.http = guild.http
+        self.id = next_id()
+        self.mention = f"<#{self.id}>"
+        guild._channels[self.id] = self
+
+    async def send(self, content=None, **kwargs):
+        await self.http.call("send_message")
+        return FakeSentMessage(self, content)
+
+    async def delete_messages(self, messages, reason=None):
+        await self.http.call("bulk_delete")
+
+
+class FakeMessage:
+    def __init__(self, channel: FakeChannel, author: FakeMember, content: str, state=None):
+        self._state = state  # the bot's ConnectionState; commands.Context reads it
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.id = next_id()
+
+
+class FakeCommand:
+    def __init__(self, name):
+        self.name = name
+        self.qualified_name = name
+
+
+class FakeResponse:
+    def __init__(self, http: FakeHTTP):
+        self.http = http
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def send_message(self, content=None, **kwargs):
+        await self.http.call("interaction_response")
+        self._done = True
+
+    async def defer(self, **kwargs):
+        await self.http.call("interaction_response")
+        self._done = True
+
+
+class FakeFollowup:
+    def __init__(self, channel: FakeChannel):
+        self.channel = channel
+
+    async def send(self, content=None, wait=False, **kwargs):
+        await self.channel.http.call("followup")
+        return FakeSentMessage(self.channel, content)
+
+
+class FakeInteraction:
+    def __init__(self, command_name: str, user: FakeMember, channel: FakeChannel):
+        self.id = next_id()
+        self.command = FakeCommand(command_name)
+        self.user = user
+        self.guild = channel.guild
+        self.guild_id = channel.guild.id
+        self.channel = channel
+        self.channel_id = channel.id
+        self.response = FakeResponse(channel.http)
+        self.followup = FakeFollowup(channel)
+
+    async def edit_original_response(self, content=None, **kwargs):
+        await self.channel.http.call("edit_original_response")
+
+    async def delete_original_response(self):
+        await self.channel.http.call("delete_original_response")
@@ -0,0 +1,121 @@
+import asyncio
+import sqlite3
+import threading
+import time
+
+# Moderation case log in SQLite.
+#
+# Commands call add(), which only appends to an in-memory buffer. A background
+# task writes buffered cases with executemany in a worker thread. Lookups use
+# keyset pagination (id < cursor) over indexes on target, moderator, action and
+# time, so a page costs the same on the first page and the ten-thousandth.
+
+FLUSH_INTERVAL = 1.0  # seconds between background writes
+BATCH_SIZE = 500      # flush early once this many cases are waiting
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cases (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    guild_id INTEGER NOT NULL,
+    action TEXT NOT NULL,
+    target_id INTEGER NOT NULL,
+    moderator_id INTEGER NOT NULL,
+    reason TEXT,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cases_target ON cases (guild_id, target_id, id);
+CREATE INDEX IF NOT EXISTS cases_moderator ON cases (guild_id, moderator_id, id);
+CREATE INDEX IF NOT EXISTS cases_action ON cases (guild_id, action, id);
+CREATE INDEX IF NOT EXISTS cases_created ON cases (guild_id, created);
+"""
+
+
+class CaseLog:
+    def __init__(self, path: str):
+        self.path = path
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flushed = None
+        self._task = None
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def pending_writes(self):
+        return len(self._pending)
+
+    def add(self, guild_id: int, action: str, target_id: int, moderator_id: int, reason: str = ""):
+        self._pending.append((guild_id, action, target_id, moderator_id, reason, time.time()))
+        if len(self._pending) >= BATCH_SIZE and self._flushed is not None:
+            self._flushed.set()
+
+    # --- Background writer ---
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._flushed = asyncio.Event()
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flushed.wait(), timeout=FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._flushed.clear()
+            await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        await asyncio.to_thread(self._write, batch)
+
+    def _write(self, batch):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO cases (guild_id, action, target_id, moderator_id, reason, created) VALUES (?, ?, ?, ?, ?, ?)",
+                batch,
+            )
+
+    def close(self):
+        # Synchronous final flush, used after the event loop has stopped
+        if self._task is not None:
+            self._task.cancel()
+        if self._pending:
+            batch, self._pending = self._pending, []
+            self._write(batch)
+        self._conn.close()
+
+    # --- Queries ---
+
+    async def search(self, guild_id: int, target_id=None, moderator_id=None, action=None, since=None, before_id=None, limit=10):
+        # Newest first. Pass the smallest id of a page as before_id for the next one.
+        await self.flush()  # Include cases logged moments ago
+        clauses, params = ["guild_id = ?"], [guild_id]
+        for column, value in (("target_id", target_id), ("moderator_id", moderator_id), ("action", action)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if before_id is not None:
+            clauses.append("id < ?")
+            params.append(before_id)
+        sql = (
+            "SELECT id, action, target_id, moderator_id, reason, created FROM cases "
+            f"WHERE {' AND '.join(clauses)} ORDER BY id DESC LIMIT ?"
+        )
+        params.append(limit)
+        return await asyncio.to_thread(self._query, sql, params, guild_id, since)
+
+    def _query(self, sql, params, guild_id, since):
+        with self._lock:
+            if since is not None:
+                # ids grow with time, so a time filter becomes an id range that
+                # the target/moderator/action indexes can use directly
+                row = self._conn.execute("SELECT MIN(id) FROM cases WHERE guild_id = ? AND created >= ?", (guild_id, since)).fetchone()
+                if row[0] is None:
+                    return []
+                sql = sql.replace("WHERE ", "WHERE id >= ? AND ", 1)
+                params = [row[0]] + params
+            return self._conn.execute(sql, params).fetchall()
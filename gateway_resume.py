@@ -0,0 +1,219 @@
+import asyncio
+import json
+import os
+import time
+
+import aiohttp
+import yarl
+import discord
+from discord.backoff import ExponentialBackoff
+from discord.ext import commands
+from discord.gateway import DiscordWebSocket, ReconnectWebSocket
+
+# Gateway session resume across process restarts.
+#
+# On a graceful shutdown the bot writes its gateway session (id, last
+# sequence number, resume URL) plus a snapshot of each guild's roles and
+# channels to disk, then closes the socket with a non-1000 code so Discord
+# keeps the session alive. The next process restores the snapshot into the
+# cache and sends RESUME instead of IDENTIFY: Discord replays only the events
+# that were missed and skips the full guild/member dump. If the session is
+# stale, Discord rejects it or the first RESUME handshake fails, connect()
+# falls back to a normal IDENTIFY. Once the saved session is live, dropped
+# connections are resumed with backoff just like discord.py's own loop.
+#
+# Single-connection bots only; AutoShardedBot keeps one session per shard.
+
+RESUME_WINDOW = 120  # seconds; older sessions have most likely expired
+
+# Close codes 1000/1001 end the session on Discord's side, anything else keeps it
+SUSPEND_CLOSE_CODE = 4000
+
+
+# --- Cache snapshot ---
+
+def _role_payload(role: discord.Role):
+    return {
+        "id": str(role.id),
+        "name": role.name,
+        "permissions": str(role.permissions.value),
+        "position": role.position,
+        "color": role.colour.value,
+        "hoist": role.hoist,
+        "managed": role.managed,
+        "mentionable": role.mentionable,
+    }
+
+
+def _channel_payload(channel: discord.abc.GuildChannel):
+    payload = {
+        "id": str(channel.id),
+        "type": channel.type.value,
+        "name": channel.name,
+        "position": channel.position,
+        "parent_id": str(channel.category_id) if channel.category_id else None,
+        "permission_overwrites": [overwrite._asdict() for overwrite in channel._overwrites],
+        "topic": getattr(channel, "topic", None),
+        "nsfw": getattr(channel, "nsfw", False),
+    }
+    if isinstance(channel, (discord.VoiceChannel, discord.StageChannel)):
+        payload.update(bitrate=channel.bitrate, user_limit=channel.user_limit, rtc_region=channel.rtc_region)
+    return payload
+
+
+def _member_payload(member: discord.Member):
+    return {
+        "user": {
+            "id": str(member.id),
+            "username": member.name,
+            "discriminator": member.discriminator,
+            "global_name": member.global_name,
+            "avatar": None,
+            "bot": member.bot,
+        },
+        "roles": [str(role.id) for role in member.roles if not role.is_default()],
+        "joined_at": member.joined_at.isoformat() if member.joined_at else None,
+        "nick": member.nick,
+        "deaf": False,
+        "mute": False,
+        "flags": 0,
+    }
+
+
+def guild_snapshot(guild: discord.Guild):
+    # Just what commands and permission checks read: roles, channels, owner and our own member
+    return {
+        "id": str(guild.id),
+        "name": guild.name,
+        "owner_id": str(guild.owner_id),
+        "member_count": guild.member_count,
+        "roles": [_role_payload(role) for role in guild.roles],
+        "channels": [_channel_payload(channel) for channel in guild.channels],
+        "members": [_member_payload(guild.me)] if guild.me else [],
+    }
+
+
+# --- Session file ---
+
+def save_session(path: str, bot: commands.Bot):
+    ws = bot.ws
+    session = {
+        "session_id": ws.session_id,
+        "sequence": ws.sequence,
+        "resume_url": str(ws.gateway),
+        "saved_at": time.time(),
+        "guilds": [guild_snapshot(guild) for guild in bot.guilds],
+    }
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(session, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def load_session(path: str):
+    # A session can only be resumed once, so the file is consumed either way
+    try:
+        with open(path, encoding="utf-8") as f:
+            session = json.load(f)
+    except (OSError, ValueError):
+        return None
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    if time.time() - session.get("saved_at", 0) > RESUME_WINDOW:
+        return None
+    return session
+
+
+# --- Bot ---
+
+class ResumableBot(commands.Bot):
+    def __init__(self, *args, session_path: str, **options):
+        super().__init__(*args, **options)
+        self.session_path = session_path
+        self._suspending = False
+        self._session_resumed = False
+        self.add_listener(self._on_session_resumed, "on_resumed")
+
+    def is_closed(self):
+        # Stops connect() from reconnecting while close() suspends the session
+        return self._suspending or super().is_closed()
+
+    async def close(self):
+        ws = self.ws
+        if not self._suspending and not super().is_closed() and self.is_ready() and ws is not None and ws.open and ws.session_id:
+            self._suspending = True
+            try:
+                save_session(self.session_path, self)
+                await ws.close(code=SUSPEND_CLOSE_CODE)
+                print(f"💾 Saved gateway session for resume ({len(self.guilds)} guilds)")
+            except Exception as e:
+                print(f"⚠️ Could not save gateway session: {e}")
+        await super().close()
+
+    async def _on_session_resumed(self):
+        # RESUME does not send READY, so wait_until_ready() would block forever
+        self._session_resumed = True
+        self._ready.set()
+
+    async def connect(self, *, reconnect: bool = True):
+        session = load_session(self.session_path)
+        if session is not None and await self._resume(session, reconnect):
+            return
+        if not self.is_closed():
+            await super().connect(reconnect=reconnect)
+
+    async def _resume(self, session, reconnect: bool):
+        # Mirrors Client.connect but starts from the saved session. Returns True
+        # once the bot is closed; False to fall back to IDENTIFY, which happens
+        # only if Discord rejects the session or the first RESUME fails
+        for data in session["guilds"]:
+            self._connection._add_guild_from_data(data)
+        backoff = ExponentialBackoff()
+        params = {
+            "initial": False,
+            "shard_id": self.shard_id,
+            "gateway": yarl.URL(session["resume_url"]),
+            "session": session["session_id"],
+            "sequence": session["sequence"],
+            "resume": True,
+        }
+        print(f"🔁 Resuming gateway session ({len(session['guilds'])} guilds from snapshot)")
+        while not self.is_closed():
+            try:
+                self.ws = await asyncio.wait_for(DiscordWebSocket.from_client(self, **params), timeout=60.0)
+                while True:
+                    await self.ws.poll_event()
+            except ReconnectWebSocket as e:
+                self.dispatch("disconnect")
+                if not e.resume or not self._session_resumed:
+                    print("🔁 Gateway session was not resumed, identifying")
+                    return False
+                params.update(sequence=self.ws.sequence, session=self.ws.session_id, gateway=self.ws.gateway)
+            except (OSError, discord.HTTPException, discord.GatewayNotFound, discord.ConnectionClosed, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.dispatch("disconnect")
+                if not self._session_resumed:
+                    if self.is_closed():
+                        return True
+                    print(f"⚠️ Resuming the saved session failed ({e!r}), identifying")
+                    return False
+                if not reconnect:
+                    await self.close()
+                    if isinstance(e, discord.ConnectionClosed) and e.code == 1000:
+                        return True
+                    raise
+                if self.is_closed():
+                    return True
+                if isinstance(e, discord.ConnectionClosed):
+                    if e.code == 4014:
+                        raise discord.PrivilegedIntentsRequired(e.shard_id) from None
+                    if e.code != 1000:
+                        await self.close()
+                        raise
+                retry = backoff.delay()
+                print(f"⚠️ Gateway connection lost ({e!r}), resuming in {retry:.1f}s")
+                await asyncio.sleep(retry)
+                params.update(sequence=self.ws.sequence, session=self.ws.session_id, gateway=self.ws.gateway)
+        return True
@@ -0,0 +1,107 @@
+from collections import defaultdict
+
+# Minimal Prometheus-style metrics registry, rendered by webserver's /metrics.
+
+counters = defaultdict(int)  # (name, labels) -> value, labels is a sorted tuple of (key, value)
+gauges = {}                  # name -> zero-argument callable returning the current value
+histograms = {}              # (name, labels) -> Histogram
+descriptions = {}            # name -> help text
+
+
+def describe(name: str, text: str):
+    descriptions[name] = text
+
+
+def inc(name: str, amount: int = 1, **labels):
+    counters[(name, tuple(sorted(labels.items())))] += amount
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q: float):
+        # Upper bound of the bucket holding the q-th observation
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 30.0)
+
+
+def observe(name: str, value: float, buckets=LATENCY_BUCKETS, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    hist = histograms.get(key)
+    if hist is None:
+        hist = histograms[key] = Histogram(buckets)
+    hist.observe(value)
+
+
+def gauge(name: str, fn, text: str = ""):
+    gauges[name] = fn
+    if text:
+        describe(name, text)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    inner = ",".join(f'{key}="{str(value).replace(chr(34), chr(39))}"' for key, value in labels)
+    return "{" + inner + "}"
+
+
+def render():
+    lines = []
+    by_name = defaultdict(list)
+    for (name, labels), value in counters.items():
+        by_name[name].append((labels, value))
+    for name in sorted(by_name):
+        if name in descriptions:
+            lines.append(f"# HELP {name} {descriptions[name]}")
+        lines.append(f"# TYPE {name} counter")
+        for labels, value in sorted(by_name[name]):
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+    hists_by_name = defaultdict(list)
+    for (name, labels), hist in histograms.items():
+        hists_by_name[name].append((labels, hist))
+    for name in sorted(hists_by_name):
+        if name in descriptions:
+            lines.append(f"# HELP {name} {descriptions[name]}")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, hist in sorted(hists_by_name[name], key=lambda item: item[0]):
+            cumulative = 0
+            for bound, n in zip(hist.buckets + ("+Inf",), hist.counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {hist.total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {hist.count}")
+    for name in sorted(gauges):
+        try:
+            value = gauges[name]()
+        except Exception:
+            continue
+        if name in descriptions:
+            lines.append(f"# HELP {name} {descriptions[name]}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -1,25 +1,85 @@
 import os
+import sys
+import json
+import hashlib
+import heapq
+import re
 import discord
 from discord.ext import commands
 from discord import app_commands
 import asyncio
-from datetime import timedelta, datetime
+import functools
+import signal
+import time
+from collections import OrderedDict, deque
+from datetime import timedelta, datetime, timezone
+from typing import Literal
 import webserver  # your webserver import
+import metrics
+from state_store import StateStore
+from outbound import OutboundScheduler
+from scheduler import TimerScheduler
+from case_log import CaseLog
+from gateway_resume import ResumableBot
+from antispam import SpamFilter
 
 # === CONFIG ===
 OWNER_ID = 620819429139415040  # Your Discord user ID
 TOKEN = os.getenv("Secret_Key") or "YOUR_DISCORD_BOT_TOKEN_HERE"
 GUILD_ID = 1100920681551642704  # Your server ID for guild command sync
-
-# Start Flask webserver in background thread
-webserver.start()
+# Servers that get the guild commands (comma-separated GUILD_IDS, defaults to GUILD_ID)
+GUILD_IDS = [int(g) for g in os.getenv("GUILD_IDS", str(GUILD_ID)).split(",") if g.strip()]
+COMMAND_GUILDS = [discord.Object(id=g) for g in GUILD_IDS]
+# SHARDED=1 runs an AutoShardedBot; SHARD_COUNT and SHARD_IDS (e.g. "0-3" or "0,2")
+# let several processes each own a range of shards (give each its own STATE_DIR)
+SHARDED = os.getenv("SHARDED") == "1"
+# LOW_MEMORY=1 skips member chunking and caches only staff and sleeping members;
+# anyone else is fetched on demand and kept in a small LRU
+LOW_MEMORY = os.getenv("LOW_MEMORY") == "1"
+MEMBER_LRU_SIZE = int(os.getenv("MEMBER_LRU_SIZE", "512"))
+SLEEP_MAX_HOURS = float(os.getenv("SLEEP_MAX_HOURS", "24"))  # Sleepers are woken silently after this long
+RECENT_JOIN_LIMIT = 5000  # Recent joiners remembered in low-memory mode for join-time filters
+STATE_DIR = os.getenv("STATE_DIR", "state")  # Where sleep/allowlist/record state is persisted
+# Sync slash commands even if their fingerprint is unchanged (--force-sync or FORCE_SYNC=1)
+FORCE_SYNC = "--force-sync" in sys.argv or os.getenv("FORCE_SYNC") == "1"
+DEFER_AFTER = float(os.getenv("DEFER_AFTER", "2.0"))  # Seconds before a slow command is deferred automatically
+MASS_CONCURRENCY = int(os.getenv("MASS_CONCURRENCY", "5"))  # Parallel REST calls for mass commands
+MASS_ACTION_LIMIT = 1000  # Most members a single mass command may act on
+# Auto-mute anyone posting SPAM_MESSAGES messages within SPAM_WINDOW seconds (0 disables);
+# opt-in raid mode: while a channel sees CHANNEL_FLOOD_MESSAGES in that window the
+# per-user limit there is halved (0, the default, turns it off)
+SPAM_MESSAGES = int(os.getenv("SPAM_MESSAGES", "6"))
+SPAM_WINDOW = float(os.getenv("SPAM_WINDOW", "5"))
+CHANNEL_FLOOD_MESSAGES = int(os.getenv("CHANNEL_FLOOD_MESSAGES", "0"))
+SPAM_MUTE_MINUTES = int(os.getenv("SPAM_MUTE_MINUTES", "10"))
+# Save the gateway session on shutdown and RESUME it on the next start (not in SHARDED mode)
+RESUME_SESSION = os.getenv("RESUME_SESSION", "1") == "1"
 
 # === Intents & Bot setup ===
 intents = discord.Intents.default()
 intents.members = True
 intents.message_content = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+def parse_shard_ids(text: str):
+    shard_ids = []
+    for part in text.split(","):
+        start, _, end = part.strip().partition("-")
+        shard_ids.extend(range(int(start), int(end or start) + 1))
+    return shard_ids
+
+bot_options = {}
+if LOW_MEMORY:
+    bot_options.update(member_cache_flags=discord.MemberCacheFlags.none(), chunk_guilds_at_startup=False)
+
+if SHARDED:
+    shard_count = int(os.environ["SHARD_COUNT"]) if os.getenv("SHARD_COUNT") else None
+    shard_ids = parse_shard_ids(os.environ["SHARD_IDS"]) if os.getenv("SHARD_IDS") else None
+    bot = commands.AutoShardedBot(command_prefix="!", intents=intents, shard_count=shard_count, shard_ids=shard_ids, **bot_options)
+elif RESUME_SESSION:
+    session_path = os.path.join(STATE_DIR, "gateway_session.json")
+    bot = ResumableBot(command_prefix="!", intents=intents, session_path=session_path, **bot_options)
+else:
+    bot = commands.Bot(command_prefix="!", intents=intents, **bot_options)
 
 # Role hierarchy (highest to lowest)
 ROLES_HIERARCHY = [
@@ -33,30 +93,283 @@ ROLES_HIERARCHY = [
 ]
 
 # === Globals for offline utility & sleep feature ===
-last_record = ""
-repeat_enabled = False
-repeat_channel_id = None
+# Restored from the state store on startup; every change is written back via state.put/delete
+state = StateStore(STATE_DIR)
+state.load()
+
+# Per-guild state is keyed by guild ID so guilds (and shards) never see each other's entries.
+# Entries saved before state was partitioned have bare keys and belong to GUILD_ID.
+
+def _guild_keyed(collection: str):
+    for key, value in list(state.get(collection).items()):
+        if not isinstance(key, tuple):
+            state.delete(collection, key)
+            key = (GUILD_ID, key)
+            state.put(collection, key, value)
+        yield key, value
+
+allowed_channels = {}  # guild_id -> channel IDs allowed for commands (set by /allowchannel)
+for (guild_id, channel_id), _ in _guild_keyed("allowed_channels"):
+    allowed_channels.setdefault(guild_id, set()).add(channel_id)
+
+allowed_servers = set(state.get("allowed_servers"))  # Servers allowed for cross-server access (set by /access)
+
+sleep_start_times = {}  # guild_id -> {user_id: datetime when /sleep was used}
+for (guild_id, user_id), ts in _guild_keyed("sleep"):
+    sleep_start_times.setdefault(guild_id, {})[user_id] = datetime.fromisoformat(ts)
+
+def sleeping_count():
+    return sum(len(sleepers) for sleepers in sleep_start_times.values())
+
+# === Sleep expiry ===
+# Deadlines live in a min-heap that one background task sleeps on, so nothing
+# is checked per message. Entries for users who already woke up are left in
+# the heap and skipped when they come due.
+
+SLEEP_MAX_DURATION = timedelta(hours=SLEEP_MAX_HOURS)
+sleep_expiry_heap = []  # (expires_at, guild_id, user_id, started)
+sleep_expiry_wakeup = asyncio.Event()
+
+def schedule_sleep_expiry(guild_id, user_id, started: datetime):
+    entry = (started + SLEEP_MAX_DURATION, guild_id, user_id, started)
+    heapq.heappush(sleep_expiry_heap, entry)
+    if sleep_expiry_heap[0] is entry:
+        sleep_expiry_wakeup.set()  # New earliest deadline
+
+def expire_sleepers(now: datetime):
+    expired = 0
+    while sleep_expiry_heap and sleep_expiry_heap[0][0] <= now:
+        _, guild_id, user_id, started = heapq.heappop(sleep_expiry_heap)
+        sleepers = sleep_start_times.get(guild_id)
+        if sleepers is None or sleepers.get(user_id) != started:
+            continue  # Woke up or slept again since
+        del sleepers[user_id]
+        state.delete("sleep", (guild_id, user_id))
+        unpin_member(bot.get_guild(guild_id), user_id)
+        expired += 1
+    return expired
+
+async def sleep_expiry_loop():
+    while True:
+        sleep_expiry_wakeup.clear()
+        if sleep_expiry_heap:
+            delay = (sleep_expiry_heap[0][0] - datetime.utcnow()).total_seconds()
+            if delay <= 0:
+                expire_sleepers(datetime.utcnow())
+                continue
+            try:
+                await asyncio.wait_for(sleep_expiry_wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+        else:
+            await sleep_expiry_wakeup.wait()
+
+for _guild_id, _sleepers in sleep_start_times.items():
+    for _user_id, _started in _sleepers.items():
+        sleep_expiry_heap.append((_started + SLEEP_MAX_DURATION, _guild_id, _user_id, _started))
+heapq.heapify(sleep_expiry_heap)
+
+# Moderation case log, written in batches by a background task
+cases = CaseLog(os.path.join(STATE_DIR, "cases.sqlite3"))
+
+def log_case(guild_id: int, action: str, target_id: int, moderator_id: int, reason: str = ""):
+    cases.add(guild_id, action, target_id, moderator_id, reason)
+
+# Coalesced, rate-paced channel sends used by on_message
+outbound = OutboundScheduler()
+
+# === Records & repeat configs ===
+# Records can be saved per channel or per server; a channel record wins over
+# the server one. Repeat mode is configured per channel, so any number of
+# channels can repeat at once, each with its own cadence.
+
+class RepeatConfig:
+    __slots__ = ("guild_id", "every", "min_interval", "count", "last_sent")
+
+    def __init__(self, guild_id, every=1, min_interval=0):
+        self.guild_id = guild_id
+        self.every = every                # repeat once every N messages
+        self.min_interval = min_interval  # and at most once per this many seconds
+        self.count = 0
+        self.last_sent = 0.0
+
+    def tick(self, now: float):
+        self.count += 1
+        if self.count < self.every or now - self.last_sent < self.min_interval:
+            return False
+        self.count = 0
+        self.last_sent = now
+        return True
+
+# State saved before per-channel records had one global record and a single
+# repeat channel in a "meta" collection; move them over once
+_meta = state.get("meta")
+if _meta:
+    if _meta.get("last_record") and GUILD_ID not in state.get("guild_records"):
+        state.put("guild_records", GUILD_ID, _meta["last_record"])
+    if _meta.get("repeat_channel_id") is not None and _meta["repeat_channel_id"] not in state.get("repeat"):
+        state.put("repeat", _meta["repeat_channel_id"], [GUILD_ID, 1, 0])
+    state.clear("meta")
+
+channel_records = dict(state.get("channel_records"))  # channel_id -> text
+guild_records = dict(state.get("guild_records"))      # guild_id -> text
+
+# channel_id -> RepeatConfig
+repeat_configs = {
+    channel_id: RepeatConfig(guild_id, every, min_interval)
+    for channel_id, (guild_id, every, min_interval) in state.get("repeat").items()
+}
 
-allowed_channels = set()  # Channels allowed for commands (set by /allowchannel)
-allowed_servers = set()   # Servers allowed for cross-server access (set by /access)
+def get_record(channel_id, guild_id):
+    return channel_records.get(channel_id) or guild_records.get(guild_id, "")
 
-sleep_start_times = {}  # user_id -> datetime when /sleep was used
+def enable_repeat(channel_id, guild_id, every, min_interval):
+    repeat_configs[channel_id] = RepeatConfig(guild_id, every, min_interval)
+    state.put("repeat", channel_id, [guild_id, every, min_interval])
+
+def disable_repeat(channel_id):
+    if repeat_configs.pop(channel_id, None) is None:
+        return False
+    state.delete("repeat", channel_id)
+    return True
+
+# === Role rank index ===
+# Precomputed per guild so permission checks are dict lookups instead of
+# scanning every role name on every interaction. Kept fresh by the role and
+# member events further down.
+
+ROLE_RANKS = {name: i for i, name in enumerate(ROLES_HIERARCHY)}
+NO_ROLE_RANK = len(ROLES_HIERARCHY) + 1
+PRIVILEGED_RANK = ROLE_RANKS["mod"]   # mod and above
+ADMIN_RANK = ROLE_RANKS["admin"]      # admin and above
+
+guild_role_ranks = {}  # guild_id -> {role_id: rank} for roles named in ROLES_HIERARCHY
+guild_rank_roles = {}  # guild_id -> {rank: role_id}, the lowest-positioned role of each rank
+member_role_ranks = {}  # guild_id -> {member_id: best rank from the member's roles}
+
+def build_role_index(guild: discord.Guild):
+    ranks, rank_roles = {}, {}
+    for role in guild.roles:
+        rank = ROLE_RANKS.get(role.name.lower())
+        if rank is not None:
+            ranks[role.id] = rank
+            rank_roles.setdefault(rank, role.id)
+    guild_role_ranks[guild.id] = ranks
+    guild_rank_roles[guild.id] = rank_roles
+    member_role_ranks[guild.id] = {}
+    return ranks
+
+def get_role_ranks(guild: discord.Guild):
+    ranks = guild_role_ranks.get(guild.id)
+    return ranks if ranks is not None else build_role_index(guild)
+
+def get_rank_role(guild: discord.Guild, rank: int):
+    get_role_ranks(guild)
+    role_id = guild_rank_roles[guild.id].get(rank)
+    return guild.get_role(role_id) if role_id is not None else None
+
+def invalidate_member_rank(guild_id: int, member_id: int):
+    cache = member_role_ranks.get(guild_id)
+    if cache is not None:
+        cache.pop(member_id, None)
+
+def get_member_role_rank(member: discord.Member):
+    # Rank from hierarchy roles only, without the owner overrides
+    guild = getattr(member, "guild", None)
+    if guild is None:
+        return NO_ROLE_RANK
+    ranks = get_role_ranks(guild)
+    cache = member_role_ranks[guild.id]
+    rank = cache.get(member.id)
+    if rank is None:
+        rank = min((ranks[r.id] for r in member.roles if r.id in ranks), default=NO_ROLE_RANK)
+        # In low-memory mode members outside the guild cache get no on_member_update,
+        # so their rank is recomputed each time instead of going stale
+        if not LOW_MEMORY or guild.get_member(member.id) is not None:
+            cache[member.id] = rank
+    return rank
+
+# === Member cache (low-memory mode) ===
+# discord.py caches no members by itself in this mode. Staff and sleeping
+# members are added to the guild cache explicitly so they keep receiving
+# member updates; everyone else seen recently sits in a small LRU.
+
+class MemberLRU:
+    def __init__(self, size: int):
+        self.size = size
+        self.members = OrderedDict()  # (guild_id, user_id) -> Member
+
+    def get(self, guild_id: int, user_id: int):
+        member = self.members.get((guild_id, user_id))
+        if member is not None:
+            self.members.move_to_end((guild_id, user_id))
+        return member
+
+    def put(self, member: discord.Member):
+        key = (member.guild.id, member.id)
+        self.members[key] = member
+        self.members.move_to_end(key)
+        if len(self.members) > self.size:
+            self.members.popitem(last=False)
+
+    def discard(self, guild_id: int, user_id: int):
+        self.members.pop((guild_id, user_id), None)
+
+member_lru = MemberLRU(MEMBER_LRU_SIZE)
+recent_joins = {}  # guild_id -> deque of recently joined Members
+
+def should_pin_member(member: discord.Member):
+    return get_member_role_rank(member) != NO_ROLE_RANK or member.id in sleep_start_times.get(member.guild.id, ())
+
+def remember_member(member):
+    # Called for members seen in events and interactions
+    if not LOW_MEMORY or not isinstance(member, discord.Member):
+        return
+    guild = member.guild
+    if guild.get_member(member.id) is not None:
+        return
+    if should_pin_member(member):
+        member_lru.discard(guild.id, member.id)
+        guild._add_member(member)
+    else:
+        member_lru.put(member)
+
+def unpin_member(guild: discord.Guild, user_id: int):
+    # Drops a member from the guild cache once they no longer need pinning
+    if not LOW_MEMORY or guild is None:
+        return
+    member = guild.get_member(user_id)
+    if member is None or member.id == bot.user.id or should_pin_member(member):
+        return
+    guild._remove_member(member)
+    invalidate_member_rank(guild.id, user_id)
+    member_lru.put(member)
+
+def get_cached_member(guild: discord.Guild, user_id: int):
+    return guild.get_member(user_id) or member_lru.get(guild.id, user_id)
+
+async def resolve_member(guild: discord.Guild, user_id: int, fresh: bool = False):
+    # fresh=True bypasses the LRU, whose entries may have outdated roles
+    member = guild.get_member(user_id) if fresh else get_cached_member(guild, user_id)
+    if member is None:
+        member = await guild.fetch_member(user_id)
+        remember_member(member)
+    return member
 
 # === Utility functions ===
 
 def get_highest_role_index(member: discord.Member):
     if member.id == OWNER_ID:
         return 0
-    member_roles = [r.name.lower() for r in member.roles]
-    indices = [ROLES_HIERARCHY.index(r) for r in member_roles if r in ROLES_HIERARCHY]
-    if indices:
-        return min(indices)  # Lower index = higher role
-    if member == member.guild.owner:
+    rank = get_member_role_rank(member)
+    if rank != NO_ROLE_RANK:
+        return rank  # Lower index = higher role
+    if member.guild.owner_id == member.id:
         return 0
-    return len(ROLES_HIERARCHY) + 1
+    return NO_ROLE_RANK
 
 def has_required_role(member: discord.Member, required_role: str):
-    required_index = ROLES_HIERARCHY.index(required_role.lower())
+    required_index = ROLE_RANKS[required_role.lower()]
     member_index = get_highest_role_index(member)
     return member_index <= required_index
 
@@ -64,235 +377,759 @@ def has_privileged_role(member: discord.Member):
     # Used for commands allowed for mod and above (mod+)
     if member.id == OWNER_ID:
         return True
-    member_roles = {r.name.lower() for r in member.roles}
-    allowed = {"mod", "head mod", "admin", "head admin", "co-owner", "owner"}
-    return any(role in member_roles for role in allowed)
+    return get_member_role_rank(member) <= PRIVILEGED_RANK
 
 def has_admin_role(member: discord.Member):
     # Admin and above
     if member.id == OWNER_ID:
         return True
-    member_roles = {r.name.lower() for r in member.roles}
-    allowed = {"admin", "head admin", "co-owner", "owner"}
-    return any(role in member_roles for role in allowed)
+    return get_member_role_rank(member) <= ADMIN_RANK
+
+async def run_bounded(items, worker, limit=MASS_CONCURRENCY, on_progress=None):
+    # Runs worker(item) for every item with at most `limit` calls in flight.
+    # Returns (succeeded_items, [(item, exception), ...]).
+    items = list(items)
+    pending = iter(items)
+    succeeded, failed = [], []
 
+    async def run_worker():
+        for item in pending:
+            try:
+                await worker(item)
+                succeeded.append(item)
+            except Exception as e:
+                failed.append((item, e))
+            if on_progress is not None:
+                await on_progress(len(succeeded) + len(failed), len(items))
+
+    await asyncio.gather(*(run_worker() for _ in range(min(limit, len(items)))))
+    return succeeded, failed
+
+
+# === Command middleware ===
+# Every slash command is wrapped by @tracked, which records latency and error
+# metrics and defers the interaction if the handler is still running after
+# DEFER_AFTER seconds, keeping us inside Discord's 3 second deadline. Handlers
+# answer through reply(), which uses the followup webhook once deferred, and
+# report failures they catch themselves through reply_error() so they still
+# count towards bot_command_errors_total.
+# The automatic defer is public, and the first followup after it replaces the
+# "thinking" message keeping its visibility, so an ephemeral reply first
+# removes that placeholder and is then sent as its own ephemeral message.
+
+auto_defers = {}  # interaction.id -> [timer handle, defer task or None]
+
+def _start_auto_defer(interaction: discord.Interaction):
+    entry = auto_defers.get(interaction.id)
+    if entry is not None and not interaction.response.is_done():
+        entry[1] = asyncio.create_task(interaction.response.defer(thinking=True))
+        metrics.inc("bot_command_auto_defers_total", command=interaction.command.qualified_name if interaction.command else "unknown")
+
+async def settle_auto_defer(interaction: discord.Interaction):
+    # Stops the pending timer, or waits for an in-flight defer to land
+    # Returns True if an automatic defer was sent
+    entry = auto_defers.pop(interaction.id, None)
+    if entry is None:
+        return False
+    entry[0].cancel()
+    if entry[1] is None:
+        return False
+    try:
+        await entry[1]
+    except discord.HTTPException:
+        return False
+    return True
+
+async def reply(interaction: discord.Interaction, content=None, **kwargs):
+    if await settle_auto_defer(interaction) and kwargs.get("ephemeral"):
+        try:
+            await interaction.edit_original_response(content="…")
+            await interaction.delete_original_response()
+        except discord.HTTPException:
+            pass
+    if interaction.response.is_done():
+        await interaction.followup.send(content, **kwargs)
+    else:
+        await interaction.response.send_message(content, **kwargs)
+
+async def reply_error(interaction: discord.Interaction, content: str):
+    # Handlers catch their own API failures, so @tracked never sees them
+    metrics.inc("bot_command_errors_total", command=interaction.command.qualified_name if interaction.command else "unknown")
+    await reply(interaction, content, ephemeral=True)
+
+async def defer(interaction: discord.Interaction):
+    await settle_auto_defer(interaction)
+    if not interaction.response.is_done():
+        await interaction.response.defer(thinking=True)
+
+def tracked(func):
+    @functools.wraps(func)
+    async def wrapper(interaction: discord.Interaction, *args, **kwargs):
+        name = interaction.command.qualified_name if interaction.command else func.__name__
+        remember_member(interaction.user)
+        timer = asyncio.get_running_loop().call_later(DEFER_AFTER, _start_auto_defer, interaction)
+        auto_defers[interaction.id] = [timer, None]
+        started = time.perf_counter()
+        try:
+            await func(interaction, *args, **kwargs)
+        except Exception:
+            metrics.inc("bot_command_errors_total", command=name)
+            raise
+        finally:
+            await settle_auto_defer(interaction)
+            metrics.inc("bot_commands_total", command=name)
+            metrics.observe("bot_command_latency_seconds", time.perf_counter() - started, command=name)
+    return wrapper
+
+# === Timed punishments ===
+# Unbans and mutes longer than Discord's 28 day timeout cap are driven by the
+# persistent timer scheduler, so they survive restarts. A long mute applies the
+# longest timeout allowed and renews it shortly before it runs out.
+
+MAX_TIMEOUT = timedelta(days=28) - timedelta(minutes=5)
+TIMEOUT_RENEW_MARGIN = timedelta(hours=1)
+MAX_DURATION_MINUTES = 60 * 24 * 365  # Longest timed mute or ban; bigger values overflow datetime
+
+timers = TimerScheduler(state)
+timers.load()
+
+def mute_key(guild_id: int, user_id: int):
+    return ("mute", guild_id, user_id)
+
+def ban_key(guild_id: int, user_id: int):
+    return ("ban", guild_id, user_id)
+
+async def apply_mute(member: discord.Member, until: datetime, reason: str):
+    now = discord.utils.utcnow()
+    key = mute_key(member.guild.id, member.id)
+    if until - now <= MAX_TIMEOUT:
+        timers.cancel(key)
+        await member.timeout(until, reason=reason)
+        return
+    await member.timeout(now + MAX_TIMEOUT, reason=reason)
+    payload = {"guild_id": member.guild.id, "user_id": member.id, "until": until.timestamp(), "reason": reason}
+    timers.schedule((now + MAX_TIMEOUT - TIMEOUT_RENEW_MARGIN).timestamp(), "mute", payload, key=key)
+
+async def mute_timer(payload):
+    guild = bot.get_guild(payload["guild_id"])
+    if guild is None:
+        return
+    try:
+        member = await resolve_member(guild, payload["user_id"], fresh=True)
+    except discord.NotFound:
+        return  # Left the server
+    until = datetime.fromtimestamp(payload["until"], timezone.utc)
+    await apply_mute(member, until, payload["reason"])
+
+async def unban_timer(payload):
+    guild = bot.get_guild(payload["guild_id"])
+    if guild is None:
+        return
+    try:
+        await guild.unban(discord.Object(id=payload["user_id"]), reason="Timed ban expired")
+    except discord.NotFound:
+        return  # Already unbanned
+    log_case(guild.id, "unban", payload["user_id"], bot.user.id, "Timed ban expired")
+
+timers.register("mute", mute_timer)
+timers.register("unban", unban_timer)
+
+async def run_timers():
+    # Handlers need the guild cache
+    await bot.wait_until_ready()
+    await timers.run()
 
 # === Moderation Commands ===
 
-@bot.tree.command(name="kick", description="Kick a member from the server", guild=discord.Object(id=GUILD_ID))
+@bot.tree.command(name="kick", description="Kick a member from the server", guilds=COMMAND_GUILDS)
 @app_commands.describe(member="Member to kick", reason="Reason for kicking")
+@tracked
 async def kick(interaction: discord.Interaction, member: discord.Member, reason: str = "No reason provided"):
     if not has_required_role(interaction.user, "mod"):
-        await interaction.response.send_message("❌ You don't have permission to use this command.", ephemeral=True)
+        await reply(interaction, "❌ You don't have permission to use this command.", ephemeral=True)
         return
     try:
         await member.kick(reason=reason)
-        await interaction.response.send_message(f"👢 {member} was kicked. Reason: {reason}")
+        log_case(interaction.guild_id, "kick", member.id, interaction.user.id, reason)
+        await reply(interaction, f"👢 {member} was kicked. Reason: {reason}")
     except discord.Forbidden:
-        await interaction.response.send_message("❌ I cannot kick this member.", ephemeral=True)
+        await reply_error(interaction, "❌ I cannot kick this member.")
     except Exception as e:
-        await interaction.response.send_message(f"❌ Error: {e}", ephemeral=True)
+        await reply_error(interaction, f"❌ Error: {e}")
 
-@bot.tree.command(name="ban", description="Ban a member from the server", guild=discord.Object(id=GUILD_ID))
-@app_commands.describe(member="Member to ban", reason="Reason for banning")
-async def ban(interaction: discord.Interaction, member: discord.Member, reason: str = "No reason provided"):
+@bot.tree.command(name="ban", description="Ban a member from the server", guilds=COMMAND_GUILDS)
+@app_commands.describe(member="Member to ban", reason="Reason for banning", duration="Ban length in minutes (0 = permanent)")
+@tracked
+async def ban(interaction: discord.Interaction, member: discord.Member, reason: str = "No reason provided", duration: app_commands.Range[int, 0, MAX_DURATION_MINUTES] = 0):
     if not has_required_role(interaction.user, "admin"):
-        await interaction.response.send_message("❌ You don't have permission to use this command.", ephemeral=True)
+        await reply(interaction, "❌ You don't have permission to use this command.", ephemeral=True)
         return
     try:
         await member.ban(reason=reason)
-        await interaction.response.send_message(f"🔨 {member} was banned. Reason: {reason}")
+        key = ban_key(interaction.guild_id, member.id)
+        log_case(interaction.guild_id, "ban", member.id, interaction.user.id, f"{reason} ({duration} min)" if duration else reason)
+        if duration:
+            unban_at = time.time() + duration * 60
+            timers.schedule(unban_at, "unban", {"guild_id": interaction.guild_id, "user_id": member.id}, key=key)
+            await reply(interaction, f"🔨 {member} was banned for {duration} minutes. Reason: {reason}")
+        else:
+            timers.cancel(key)
+            await reply(interaction, f"🔨 {member} was banned. Reason: {reason}")
     except discord.Forbidden:
-        await interaction.response.send_message("❌ I cannot ban this member.", ephemeral=True)
+        await reply_error(interaction, "❌ I cannot ban this member.")
     except Exception as e:
-        await interaction.response.send_message(f"❌ Error: {e}", ephemeral=True)
+        await reply_error(interaction, f"❌ Error: {e}")
 
-@bot.tree.command(name="unban", description="Unban a user", guild=discord.Object(id=GUILD_ID))
+@bot.tree.command(name="unban", description="Unban a user", guilds=COMMAND_GUILDS)
 @app_commands.describe(user="User to unban")
+@tracked
 async def unban(interaction: discord.Interaction, user: discord.User):
     if not has_required_role(interaction.user, "admin"):
-        await interaction.response.send_message("❌ You don't have permission to use this command.", ephemeral=True)
+        await reply(interaction, "❌ You don't have permission to use this command.", ephemeral=True)
         return
     try:
+        timers.cancel(ban_key(interaction.guild_id, user.id))
         await interaction.guild.unban(user)
-        await interaction.response.send_message(f"♻️ {user} has been unbanned.")
+        log_case(interaction.guild_id, "unban", user.id, interaction.user.id)
+        await reply(interaction, f"♻️ {user} has been unbanned.")
     except discord.NotFound:
-        await interaction.response.send_message("❌ User not found in ban list.", ephemeral=True)
+        await reply_error(interaction, "❌ User not found in ban list.")
     except Exception as e:
-        await interaction.response.send_message(f"❌ Error: {e}", ephemeral=True)
+        await reply_error(interaction, f"❌ Error: {e}")
 
-@bot.tree.command(name="mute", description="Timeout a member", guild=discord.Object(id=GUILD_ID))
+@bot.tree.command(name="mute", description="Timeout a member", guilds=COMMAND_GUILDS)
 @app_commands.describe(member="Member to mute", duration="Duration in minutes", reason="Reason for muting")
-async def mute(interaction: discord.Interaction, member: discord.Member, duration: int, reason: str = "No reason provided"):
+@tracked
+async def mute(interaction: discord.Interaction, member: discord.Member, duration: app_commands.Range[int, 1, MAX_DURATION_MINUTES], reason: str = "No reason provided"):
     if not has_required_role(interaction.user, "mod"):
-        await interaction.response.send_message("❌ You don't have permission to use this command.", ephemeral=True)
+        await reply(interaction, "❌ You don't have permission to use this command.", ephemeral=True)
         return
     until = discord.utils.utcnow() + timedelta(minutes=duration)
     try:
-        await member.timeout(until, reason=reason)
-        await interaction.response.send_message(f"🔇 {member} muted for {duration} minutes. Reason: {reason}")
+        await apply_mute(member, until, reason)
+        log_case(interaction.guild_id, "mute", member.id, interaction.user.id, f"{reason} ({duration} min)")
+        await reply(interaction, f"🔇 {member} muted for {duration} minutes. Reason: {reason}")
     except discord.Forbidden:
-        await interaction.response.send_message("❌ I cannot timeout this member.", ephemeral=True)
+        await reply_error(interaction, "❌ I cannot timeout this member.")
     except Exception as e:
-        await interaction.response.send_message(f"❌ Error: {e}", ephemeral=True)
+        await reply_error(interaction, f"❌ Error: {e}")
 
-@bot.tree.command(name="unmute", description="Remove timeout from a member", guild=discord.Object(id=GUILD_ID))
+@bot.tree.command(name="unmute", description="Remove timeout from a member", guilds=COMMAND_GUILDS)
 @app_commands.describe(member="Member to unmute")
+@tracked
 async def unmute(interaction: discord.Interaction, member: discord.Member):
     if not has_required_role(interaction.user, "mod"):
-        await interaction.response.send_message("❌ You don't have permission to use this command.", ephemeral=True)
+        await reply(interaction, "❌ You don't have permission to use this command.", ephemeral=True)
         return
     try:
+        timers.cancel(mute_key(interaction.guild_id, member.id))
         await member.timeout(None)
-        await interaction.response.send_message(f"🔊 {member} has been unmuted.")
+        log_case(interaction.guild_id, "unmute", member.id, interaction.user.id)
+        await reply(interaction, f"🔊 {member} has been unmuted.")
     except Exception as e:
-        await interaction.response.send_message(f"❌ Error: {e}", ephemeral=True)
+        await reply_error(interaction, f"❌ Error: {e}")
+
+# === Bulk Moderation Commands ===
+# For raids: act on many members at once. Targets come from mentions/IDs and/or
+# join-time and account-age filters. Staff, the bot, the owner and the invoker
+# are never targeted.
+
+ID_PATTERN = re.compile(r"\d{15,20}")
+PROGRESS_INTERVAL = 2.0  # seconds between progress message edits
+
+class ProgressMessage:
+    def __init__(self, message: discord.WebhookMessage, label: str):
+        self.message = message
+        self.label = label
+        self.last_edit = time.monotonic()
+
+    async def update(self, done: int, total: int):
+        now = time.monotonic()
+        if done < total and now - self.last_edit < PROGRESS_INTERVAL:
+            return
+        self.last_edit = now
+        try:
+            await self.message.edit(content=f"⏳ {self.label}: {done}/{total}")
+        except discord.HTTPException:
+            pass
+
+def is_protected_target(guild: discord.Guild, invoker: discord.Member, target):
+    if target.id in (OWNER_ID, invoker.id, guild.owner_id, bot.user.id):
+        return True
+    return isinstance(target, discord.Member) and get_member_role_rank(target) != NO_ROLE_RANK
+
+async def resolve_targets(interaction: discord.Interaction, members: str, joined_within: int, account_age: int):
+    # Returns (targets, skipped). Listed IDs that are not guild members stay as
+    # bare discord.Object targets unless a filter needs member data.
+    guild = interaction.guild
+    now = discord.utils.utcnow()
+    filtered = bool(joined_within or account_age)
+
+    ids = list(dict.fromkeys(int(raw) for raw in ID_PATTERN.findall(members or "")))
+    if ids:
+        found = {}
+        if LOW_MEMORY:
+            # The cache is partial, so look everyone up to keep staff protected
+            async def lookup(uid):
+                found[uid] = await resolve_member(guild, uid)
+            await run_bounded(ids, lookup)
+        else:
+            found = {uid: guild.get_member(uid) for uid in ids}
+        candidates = [found.get(uid) or discord.Object(id=uid) for uid in ids]
+    elif filtered and LOW_MEMORY:
+        # Only recent joiners and recently active members are known
+        known = {m.id: m for m in recent_joins.get(guild.id, ())}
+        known.update((m.id, m) for (gid, _), m in member_lru.members.items() if gid == guild.id)
+        known.update((m.id, m) for m in guild.members)
+        candidates = list(known.values())
+    elif filtered:
+        candidates = guild.members
+    else:
+        return [], 0
+
+    targets, skipped = [], 0
+    for target in candidates:
+        if filtered:
+            if not isinstance(target, discord.Member):
+                skipped += 1
+                continue
+            if joined_within and (target.joined_at is None or now - target.joined_at > timedelta(minutes=joined_within)):
+                continue
+            if account_age and now - target.created_at > timedelta(days=account_age):
+                continue
+        if is_protected_target(guild, interaction.user, target):
+            skipped += 1
+            continue
+        targets.append(target)
+    return targets[:MASS_ACTION_LIMIT], skipped + max(0, len(targets) - MASS_ACTION_LIMIT)
+
+async def start_mass_action(interaction: discord.Interaction, members: str, joined_within: int, account_age: int, label: str):
+    # Defers, resolves targets and posts the progress message. Returns
+    # (targets, skipped, progress) or None if nothing matched.
+    await defer(interaction)
+    targets, skipped = await resolve_targets(interaction, members, joined_within, account_age)
+    if not targets:
+        await interaction.followup.send(f"⚠️ No members matched ({skipped} skipped). Pass members or a filter.")
+        return None
+    message = await interaction.followup.send(f"⏳ {label}: 0/{len(targets)}", wait=True)
+    return targets, skipped, ProgressMessage(message, label)
+
+async def finish_mass_action(progress: ProgressMessage, verb: str, succeeded: int, failed: list, skipped: int):
+    summary = f"✅ {progress.label} finished: {succeeded} {verb}, {len(failed)} failed, {skipped} skipped."
+    if failed:
+        sample = ", ".join(f"<@{target.id}>" for target, _ in failed[:10])
+        summary += f"\nFailed: {sample}{' …' if len(failed) > 10 else ''}"
+    await progress.message.edit(content=summary)
+
+@bot.tree.command(name="masskick", description="Kick many members at once", guilds=COMMAND_GUILDS)
+@app_commands.describe(
+    members="Mentions or IDs separated by spaces",
+    joined_within="Only members who joined in the last N minutes",
+    account_age="Only accounts younger than N days",
+    reason="Reason for kicking",
+)
+@tracked
+async def masskick(interaction: discord.Interaction, members: str = "", joined_within: int = 0, account_age: int = 0, reason: str = "No reason provided"):
+    if not has_required_role(interaction.user, "mod"):
+        await reply(interaction, "❌ You don't have permission to use this command.", ephemeral=True)
+        return
+    started = await start_mass_action(interaction, members, joined_within, account_age, "Mass kick")
+    if started is None:
+        return
+    targets, skipped, progress = started
+    succeeded, failed = await run_bounded(
+        targets, lambda target: interaction.guild.kick(target, reason=reason), on_progress=progress.update
+    )
+    for target in succeeded:
+        log_case(interaction.guild_id, "kick", target.id, interaction.user.id, f"[mass] {reason}")
+    await finish_mass_action(progress, "kicked", len(succeeded), failed, skipped)
+
+@bot.tree.command(name="massban", description="Ban many members at once", guilds=COMMAND_GUILDS)
+@app_commands.describe(
+    members="Mentions or IDs separated by spaces",
+    joined_within="Only members who joined in the last N minutes",
+    account_age="Only accounts younger than N days",
+    reason="Reason for banning",
+)
+@tracked
+async def massban(interaction: discord.Interaction, members: str = "", joined_within: int = 0, account_age: int = 0, reason: str = "No reason provided"):
+    if not has_required_role(interaction.user, "admin"):
+        await reply(interaction, "❌ You don't have permission to use this command.", ephemeral=True)
+        return
+    started = await start_mass_action(interaction, members, joined_within, account_age, "Mass ban")
+    if started is None:
+        return
+    targets, skipped, progress = started
+    guild = interaction.guild
+    # One request per 200 users instead of one per user
+    banned, failed = [], []
+    done = 0
+    while done < len(targets):
+        chunk = targets[done:done + 200]
+        try:
+            result = await guild.bulk_ban(chunk, reason=reason)
+        except discord.Forbidden:
+            break  # bulk_ban also needs Manage Server; ban the rest one by one
+        except discord.HTTPException as e:
+            failed.extend((target, e) for target in chunk)
+        else:
+            banned.extend(result.banned)
+            failed.extend((target, None) for target in result.failed)
+        done += len(chunk)
+        await progress.update(done, len(targets))
+    if done < len(targets):
+        offset = done
+        succeeded, single_failed = await run_bounded(
+            targets[offset:], lambda target: guild.ban(target, reason=reason),
+            on_progress=lambda count, total: progress.update(offset + count, offset + total),
+        )
+        banned.extend(succeeded)
+        failed.extend(single_failed)
+    for target in banned:
+        log_case(interaction.guild_id, "ban", target.id, interaction.user.id, f"[mass] {reason}")
+    await finish_mass_action(progress, "banned", len(banned), failed, skipped)
+
+@bot.tree.command(name="massmute", description="Timeout many members at once", guilds=COMMAND_GUILDS)
+@app_commands.describe(
+    duration="Duration in minutes",
+    members="Mentions or IDs separated by spaces",
+    joined_within="Only members who joined in the last N minutes",
+    account_age="Only accounts younger than N days",
+    reason="Reason for muting",
+)
+@tracked
+async def massmute(interaction: discord.Interaction, duration: app_commands.Range[int, 1, MAX_DURATION_MINUTES], members: str = "", joined_within: int = 0, account_age: int = 0, reason: str = "No reason provided"):
+    if not has_required_role(interaction.user, "mod"):
+        await reply(interaction, "❌ You don't have permission to use this command.", ephemeral=True)
+        return
+    started = await start_mass_action(interaction, members, joined_within, account_age, "Mass mute")
+    if started is None:
+        return
+    targets, skipped, progress = started
+    until = discord.utils.utcnow() + timedelta(minutes=duration)
+
+    async def mute_target(target):
+        if not isinstance(target, discord.Member):
+            target = await resolve_member(interaction.guild, target.id)
+        await apply_mute(target, until, reason)
+
+    succeeded, failed = await run_bounded(targets, mute_target, on_progress=progress.update)
+    for target in succeeded:
+        log_case(interaction.guild_id, "mute", target.id, interaction.user.id, f"[mass] {reason} ({duration} min)")
+    await finish_mass_action(progress, "muted", len(succeeded), failed, skipped)
 
 # === Role Management Commands ===
 
-@bot.tree.command(name="promote", description="Promote a member to the next higher role", guild=discord.Object(id=GUILD_ID))
+# Promotion moves a member from their lowest staff role one step up; demotion
+# moves them from their highest staff role one step down. The new role set is
+# applied with a single member.edit call so a failure never leaves the member
+# without a staff role.
+
+PROMOTE, DEMOTE = -1, 1
+
+def plan_role_transition(member: discord.Member, step: int):
+    # Returns (new_role, roles) for member.edit, or None if no move is possible
+    guild = member.guild
+    ranks = get_role_ranks(guild)
+    held = sorted({ranks[r.id] for r in member.roles if r.id in ranks}, reverse=(step == PROMOTE))
+    for current in held:
+        target = current + step
+        if not 0 <= target < len(ROLES_HIERARCHY):
+            continue
+        new_role = get_rank_role(guild, target)
+        if new_role is None:
+            continue
+        roles = [r for r in member.roles if not r.is_default() and ranks.get(r.id) != current]
+        roles.append(new_role)
+        return new_role, roles
+    return None
+
+async def apply_role_transition(member: discord.Member, step: int, moderator: discord.abc.User):
+    plan = plan_role_transition(member, step)
+    if plan is None:
+        return None
+    new_role, roles = plan
+    action = "promote" if step == PROMOTE else "demote"
+    await member.edit(roles=roles, reason=f"{action.capitalize()}d by {moderator}")
+    log_case(member.guild.id, action, member.id, moderator.id, f"to {new_role.name}")
+    return new_role
+
+async def resolve_members(guild: discord.Guild, members: str):
+    # Mentions/IDs -> Members, fetching any that are not cached
+    resolved, missing = [], []
+    for uid in dict.fromkeys(int(raw) for raw in ID_PATTERN.findall(members)):
+        try:
+            # Role transitions need current roles, so skip the LRU
+            member = await resolve_member(guild, uid, fresh=True)
+        except discord.HTTPException:
+            missing.append(uid)
+            continue
+        resolved.append(member)
+    return resolved, missing
+
+@bot.tree.command(name="promote", description="Promote a member to the next higher role", guilds=COMMAND_GUILDS)
 @app_commands.describe(member="Member to promote")
+@tracked
 async def promote(interaction: discord.Interaction, member: discord.Member):
     if not has_required_role(interaction.user, "admin"):
-        await interaction.response.send_message("❌ You don't have permission.", ephemeral=True)
-        return
-
-    member_roles = [r.name.lower() for r in member.roles]
-    for i in reversed(range(len(ROLES_HIERARCHY) - 1)):
-        if ROLES_HIERARCHY[i + 1] in member_roles:
-            new_role = discord.utils.get(interaction.guild.roles, name=ROLES_HIERARCHY[i])
-            old_role = discord.utils.get(interaction.guild.roles, name=ROLES_HIERARCHY[i + 1])
-            if new_role and old_role:
-                await member.remove_roles(old_role)
-                await member.add_roles(new_role)
-                await interaction.response.send_message(f"⬆️ {member} promoted to {new_role.name}.")
-                return
-    await interaction.response.send_message("⚠️ This member cannot be promoted further.", ephemeral=True)
-
-@bot.tree.command(name="demote", description="Demote a member to the next lower role", guild=discord.Object(id=GUILD_ID))
+        await reply(interaction, "❌ You don't have permission.", ephemeral=True)
+        return
+    try:
+        new_role = await apply_role_transition(member, PROMOTE, interaction.user)
+    except discord.Forbidden:
+        await reply_error(interaction, "❌ I cannot change this member's roles.")
+        return
+    if new_role is None:
+        await reply(interaction, "⚠️ This member cannot be promoted further.", ephemeral=True)
+        return
+    await reply(interaction, f"⬆️ {member} promoted to {new_role.name}.")
+
+@bot.tree.command(name="demote", description="Demote a member to the next lower role", guilds=COMMAND_GUILDS)
 @app_commands.describe(member="Member to demote")
+@tracked
 async def demote(interaction: discord.Interaction, member: discord.Member):
     if not has_required_role(interaction.user, "admin"):
-        await interaction.response.send_message("❌ You don't have permission.", ephemeral=True)
+        await reply(interaction, "❌ You don't have permission.", ephemeral=True)
         return
+    try:
+        new_role = await apply_role_transition(member, DEMOTE, interaction.user)
+    except discord.Forbidden:
+        await reply_error(interaction, "❌ I cannot change this member's roles.")
+        return
+    if new_role is None:
+        await reply(interaction, "⚠️ This member cannot be demoted further.", ephemeral=True)
+        return
+    await reply(interaction, f"⬇️ {member} demoted to {new_role.name}.")
+
+async def run_batch_transition(interaction: discord.Interaction, members: str, step: int, label: str):
+    await defer(interaction)
+    targets, missing = await resolve_members(interaction.guild, members)
+    if not targets:
+        await interaction.followup.send("⚠️ No members matched. Pass mentions or IDs.")
+        return
+    message = await interaction.followup.send(f"⏳ {label}: 0/{len(targets)}", wait=True)
+    progress = ProgressMessage(message, label)
+    moved = []
+
+    async def transition(member):
+        new_role = await apply_role_transition(member, step, interaction.user)
+        if new_role is not None:
+            moved.append(f"{member} → {new_role.name}")
 
-    member_roles = [r.name.lower() for r in member.roles]
-    for i in range(len(ROLES_HIERARCHY) - 1):
-        if ROLES_HIERARCHY[i] in member_roles:
-            new_role = discord.utils.get(interaction.guild.roles, name=ROLES_HIERARCHY[i + 1])
-            old_role = discord.utils.get(interaction.guild.roles, name=ROLES_HIERARCHY[i])
-            if new_role and old_role:
-                await member.remove_roles(old_role)
-                await member.add_roles(new_role)
-                await interaction.response.send_message(f"⬇️ {member} demoted to {new_role.name}.")
-                return
-    await interaction.response.send_message("⚠️ This member cannot be demoted further.", ephemeral=True)
+    succeeded, failed = await run_bounded(targets, transition, on_progress=progress.update)
+    unchanged = len(succeeded) - len(moved)
+    await finish_mass_action(progress, "moved", len(moved), failed, len(missing) + unchanged)
+
+@bot.tree.command(name="masspromote", description="Promote many members to their next higher role", guilds=COMMAND_GUILDS)
+@app_commands.describe(members="Mentions or IDs separated by spaces")
+@tracked
+async def masspromote(interaction: discord.Interaction, members: str):
+    if not has_required_role(interaction.user, "admin"):
+        await reply(interaction, "❌ You don't have permission.", ephemeral=True)
+        return
+    await run_batch_transition(interaction, members, PROMOTE, "Mass promote")
+
+@bot.tree.command(name="massdemote", description="Demote many members to their next lower role", guilds=COMMAND_GUILDS)
+@app_commands.describe(members="Mentions or IDs separated by spaces")
+@tracked
+async def massdemote(interaction: discord.Interaction, members: str):
+    if not has_required_role(interaction.user, "admin"):
+        await reply(interaction, "❌ You don't have permission.", ephemeral=True)
+        return
+    await run_batch_transition(interaction, members, DEMOTE, "Mass demote")
 
 # === Offline Utility Commands ===
 
-@bot.tree.command(name="record", description="Save a record (Mods & above)", guild=discord.Object(id=GUILD_ID))
-@app_commands.describe(text="Text to save as record")
-async def record_cmd(interaction: discord.Interaction, text: str):
-    global last_record
+@bot.tree.command(name="record", description="Save a record (Mods & above)", guilds=COMMAND_GUILDS)
+@app_commands.describe(text="Text to save as record", scope="Save for this channel only or as the server-wide default")
+@tracked
+async def record_cmd(interaction: discord.Interaction, text: str, scope: Literal["channel", "server"] = "channel"):
     if not has_required_role(interaction.user, "mod"):
-        await interaction.response.send_message("❌ You don't have permission.", ephemeral=True)
+        await reply(interaction, "❌ You don't have permission.", ephemeral=True)
         return
-    last_record = text
-    await interaction.response.send_message(f"✅ Record saved: {text}")
+    if scope == "server":
+        guild_records[interaction.guild_id] = text
+        state.put("guild_records", interaction.guild_id, text)
+    else:
+        channel_records[interaction.channel_id] = text
+        state.put("channel_records", interaction.channel_id, text)
+    await reply(interaction, f"✅ Record saved ({scope}): {text}")
 
-@bot.tree.command(name="print", description="Print the last record (Mods & above)", guild=discord.Object(id=GUILD_ID))
+@bot.tree.command(name="print", description="Print the last record (Mods & above)", guilds=COMMAND_GUILDS)
+@tracked
 async def print_cmd(interaction: discord.Interaction):
     if not has_required_role(interaction.user, "mod"):
-        await interaction.response.send_message("❌ You don't have permission.", ephemeral=True)
+        await reply(interaction, "❌ You don't have permission.", ephemeral=True)
         return
-    await interaction.response.send_message(f"📝 Last record: {last_record or 'No record saved.'}")
+    record = get_record(interaction.channel_id, interaction.guild_id)
+    await reply(interaction, f"📝 Last record: {record or 'No record saved.'}")
 
-@bot.tree.command(name="repeat", description="Toggle repeating the last record in this channel (Mods & above)", guild=discord.Object(id=GUILD_ID))
-async def repeat_cmd(interaction: discord.Interaction):
-    global repeat_enabled, repeat_channel_id
+@bot.tree.command(name="repeat", description="Toggle repeating the last record in this channel (Mods & above)", guilds=COMMAND_GUILDS)
+@app_commands.describe(every="Repeat once every N messages", min_interval="Minimum seconds between repeats")
+@tracked
+async def repeat_cmd(interaction: discord.Interaction, every: app_commands.Range[int, 1] = None, min_interval: app_commands.Range[int, 0] = None):
     if not has_required_role(interaction.user, "mod"):
-        await interaction.response.send_message("❌ You don't have permission.", ephemeral=True)
+        await reply(interaction, "❌ You don't have permission.", ephemeral=True)
+        return
+    # Without options the command toggles; with options it enables or updates
+    config = repeat_configs.get(interaction.channel_id)
+    if config is not None and every is None and min_interval is None:
+        disable_repeat(interaction.channel_id)
+        await reply(interaction, "🔁 Repeat mode disabled in this channel.")
         return
-    repeat_enabled = not repeat_enabled
-    repeat_channel_id = interaction.channel_id if repeat_enabled else None
-    await interaction.response.send_message(f"🔁 Repeat mode {'enabled' if repeat_enabled else 'disabled'} in this channel.")
+    if every is None:
+        every = config.every if config else 1
+    if min_interval is None:
+        min_interval = config.min_interval if config else 0
+    enable_repeat(interaction.channel_id, interaction.guild_id, every, min_interval)
+    await reply(interaction, 
+        f"🔁 Repeat mode {'updated' if config else 'enabled'} in this channel (every {every} message(s), at most once per {min_interval}s)."
+    )
 
-@bot.tree.command(name="stop", description="Stop repeat mode manually (Mods & above)", guild=discord.Object(id=GUILD_ID))
-async def stop_cmd(interaction: discord.Interaction):
-    global repeat_enabled, repeat_channel_id
+@bot.tree.command(name="stop", description="Stop repeat mode manually (Mods & above)", guilds=COMMAND_GUILDS)
+@app_commands.describe(all_channels="Stop repeat mode in every channel of this server")
+@tracked
+async def stop_cmd(interaction: discord.Interaction, all_channels: bool = False):
     if not has_required_role(interaction.user, "mod"):
-        await interaction.response.send_message("❌ You don't have permission.", ephemeral=True)
+        await reply(interaction, "❌ You don't have permission.", ephemeral=True)
         return
-    repeat_enabled = False
-    repeat_channel_id = None
-    await interaction.response.send_message("🛑 Repeat mode manually stopped.")
+    if all_channels:
+        channel_ids = [cid for cid, cfg in repeat_configs.items() if cfg.guild_id == interaction.guild_id]
+        for channel_id in channel_ids:
+            disable_repeat(channel_id)
+        await reply(interaction, f"🛑 Repeat mode manually stopped in {len(channel_ids)} channel(s).")
+        return
+    disable_repeat(interaction.channel_id)
+    await reply(interaction, "🛑 Repeat mode manually stopped.")
 
-@bot.tree.command(name="refresh", description="Erase the saved record and stop repeat (Mods & above)", guild=discord.Object(id=GUILD_ID))
-async def refresh_cmd(interaction: discord.Interaction):
-    global last_record, repeat_enabled, repeat_channel_id
+@bot.tree.command(name="refresh", description="Erase the saved record and stop repeat (Mods & above)", guilds=COMMAND_GUILDS)
+@app_commands.describe(scope="Clear this channel's record and repeat, or the server-wide default record")
+@tracked
+async def refresh_cmd(interaction: discord.Interaction, scope: Literal["channel", "server"] = "channel"):
     if not has_required_role(interaction.user, "mod"):
-        await interaction.response.send_message("❌ You don't have permission.", ephemeral=True)
+        await reply(interaction, "❌ You don't have permission.", ephemeral=True)
+        return
+    if scope == "server":
+        if guild_records.pop(interaction.guild_id, None) is not None:
+            state.delete("guild_records", interaction.guild_id)
+        await reply(interaction, "♻️ Server record cleared.")
         return
-    last_record = ""
-    repeat_enabled = False
-    repeat_channel_id = None
-    await interaction.response.send_message("♻️ Record cleared and repeat mode disabled.")
+    if channel_records.pop(interaction.channel_id, None) is not None:
+        state.delete("channel_records", interaction.channel_id)
+    disable_repeat(interaction.channel_id)
+    await reply(interaction, "♻️ Record cleared and repeat mode disabled.")
 
 # === Sleep / AllowChannel / Access Commands ===
 
 # Owner-only: Allow current channel for sleep commands for members below mod+
 @bot.tree.command(name="allowchannel", description="Owner only: Allow current channel for members to use sleep")
+@tracked
 async def allowchannel_cmd(interaction: discord.Interaction):
     if interaction.user.id != OWNER_ID:
-        await interaction.response.send_message("❌ You don't have permission.", ephemeral=True)
+        await reply(interaction, "❌ You don't have permission.", ephemeral=True)
         return
-    allowed_channels.add(interaction.channel_id)
-    await interaction.response.send_message(f"✅ Channel <#{interaction.channel_id}> allowed for members to use sleep commands.")
+    allowed_channels.setdefault(interaction.guild_id, set()).add(interaction.channel_id)
+    state.put("allowed_channels", (interaction.guild_id, interaction.channel_id), True)
+    await reply(interaction, f"✅ Channel <#{interaction.channel_id}> allowed for members to use sleep commands.")
 
 # Owner-only: Allow server id for cross-server commands (you can expand usage)
 @bot.tree.command(name="access", description="Owner only: Allow a server ID for cross-server access")
 @app_commands.describe(server_id="Server ID to allow access")
+@tracked
 async def access_cmd(interaction: discord.Interaction, server_id: str):
     if interaction.user.id != OWNER_ID:
-        await interaction.response.send_message("❌ You don't have permission.", ephemeral=True)
+        await reply(interaction, "❌ You don't have permission.", ephemeral=True)
         return
     try:
         allowed_servers.add(int(server_id))
-        await interaction.response.send_message(f"✅ Access granted for server ID {server_id}.")
+        state.put("allowed_servers", int(server_id), True)
+        await reply(interaction, f"✅ Access granted for server ID {server_id}.")
     except ValueError:
-        await interaction.response.send_message("❌ Invalid server ID.", ephemeral=True)
+        await reply(interaction, "❌ Invalid server ID.", ephemeral=True)
 
 # Sleep command: mods+ anywhere OR members in allowed channels only
 @bot.tree.command(name="sleep", description="Start your sleep timer")
+@tracked
 async def sleep_cmd(interaction: discord.Interaction):
     user = interaction.user
-    if not has_privileged_role(user) and interaction.channel_id not in allowed_channels:
-        await interaction.response.send_message("❌ You can only use this command in allowed channels.", ephemeral=True)
+    if not has_privileged_role(user) and interaction.channel_id not in allowed_channels.get(interaction.guild_id, ()):
+        await reply(interaction, "❌ You can only use this command in allowed channels.", ephemeral=True)
         return
-    sleep_start_times[user.id] = datetime.utcnow()
-    await interaction.response.send_message(f"😴 {user.mention}, you are now marked as sleeping. Sweet dreams!")
+    started = datetime.utcnow()
+    sleep_start_times.setdefault(interaction.guild_id, {})[user.id] = started
+    state.put("sleep", (interaction.guild_id, user.id), started.isoformat())
+    schedule_sleep_expiry(interaction.guild_id, user.id, started)
+    remember_member(user)
+    await reply(interaction, f"😴 {user.mention}, you are now marked as sleeping. Sweet dreams!")
+
+# Sleeping list command (admins+): longest sleepers first, one page at a time
+
+SLEEPING_PAGE_SIZE = 20
+
+def format_duration(delta: timedelta):
+    minutes = int(delta.total_seconds()) // 60
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m" if hours else f"{minutes}m"
+
+class SleepingView(discord.ui.View):
+    def __init__(self, invoker_id: int, entries):
+        super().__init__(timeout=180)
+        self.invoker_id = invoker_id
+        self.entries = entries  # [(started, user_id)] sorted oldest first
+        self.page = 0
+        self.pages = (len(entries) + SLEEPING_PAGE_SIZE - 1) // SLEEPING_PAGE_SIZE
+        self.update_buttons()
 
-# Sleeping list command (admins+)
-@bot.tree.command(name="sleeping", description="Show list of sleeping users (Admins+ only)", guild=discord.Object(id=GUILD_ID))
+    def render(self):
+        now = datetime.utcnow()
+        start = self.page * SLEEPING_PAGE_SIZE
+        lines = [f"😴 Currently sleeping ({len(self.entries)}) — page {self.page + 1}/{self.pages}"]
+        for i, (started, user_id) in enumerate(self.entries[start:start + SLEEPING_PAGE_SIZE], start=start + 1):
+            lines.append(f"{i}. <@{user_id}> — {format_duration(now - started)}")
+        return "\n".join(lines)
+
+    def update_buttons(self):
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page >= self.pages - 1
+
+    async def interaction_check(self, interaction: discord.Interaction):
+        return interaction.user.id == self.invoker_id
+
+    async def turn(self, interaction: discord.Interaction, step: int):
+        self.page = max(0, min(self.pages - 1, self.page + step))
+        self.update_buttons()
+        await interaction.response.edit_message(content=self.render(), view=self)
+
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.turn(interaction, -1)
+
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.turn(interaction, 1)
+
+@bot.tree.command(name="sleeping", description="Show list of sleeping users (Admins+ only)", guilds=COMMAND_GUILDS)
+@tracked
 async def sleeping_cmd(interaction: discord.Interaction):
     if not has_admin_role(interaction.user):
-        await interaction.response.send_message("❌ You don't have permission to use this command.", ephemeral=True)
+        await reply(interaction, "❌ You don't have permission to use this command.", ephemeral=True)
         return
-    if not sleep_start_times:
-        await interaction.response.send_message("Nobody is currently sleeping.")
+    sleepers = sleep_start_times.get(interaction.guild_id)
+    if not sleepers:
+        await reply(interaction, "Nobody is currently sleeping.")
         return
-    mentions = []
-    for user_id in sleep_start_times.keys():
-        user = bot.get_user(user_id)
-        mentions.append(user.mention if user else f"<@{user_id}>")
-    await interaction.response.send_message(f"😴 Currently sleeping: {', '.join(mentions)}")
+    entries = sorted((started, user_id) for user_id, started in sleepers.items())
+    view = SleepingView(interaction.user.id, entries)
+    kwargs = {"view": view} if view.pages > 1 else {}
+    await reply(interaction, view.render(), allowed_mentions=discord.AllowedMentions.none(), **kwargs)
 
 # === Info Commands ===
 
-@bot.tree.command(name="server_rules", description="Show Akane's usage rules for the server", guild=discord.Object(id=GUILD_ID))
+@bot.tree.command(name="server_rules", description="Show Akane's usage rules for the server", guilds=COMMAND_GUILDS)
+@tracked
 async def server_rules_cmd(interaction: discord.Interaction):
     if not has_required_role(interaction.user, "mod"):
-        await interaction.response.send_message("❌ You don't have permission to use this.", ephemeral=True)
+        await reply(interaction, "❌ You don't have permission to use this.", ephemeral=True)
         return
 
     embed = discord.Embed(
@@ -317,10 +1154,13 @@ async def server_rules_cmd(interaction: discord.Interaction):
         name="⚙️ Moderation Commands",
         value=(
             "/kick member:@User reason:<text> — Kick a member (Mods+)\n"
-            "/ban member:@User reason:<text> — Ban a member (Admins+)\n"
+            "/ban member:@User reason:<text> duration:<minutes> — Ban a member, optionally timed (Admins+)\n"
             "/unban user:User#1234 — Unban a user (Admins+)\n"
-            "/mute member:@User duration:<minutes> reason:<text> — Timeout a member (Mods+)\n"
-            "/unmute member:@User — Remove timeout (Mods+)"
+            "/mute member:@User duration:<minutes> reason:<text> — Timeout a member, any length (Mods+)\n"
+            "/unmute member:@User — Remove timeout (Mods+)\n"
+            "/masskick, /massmute members:<ids> joined_within:<min> account_age:<days> — Bulk actions (Mods+)\n"
+            "/massban members:<ids> joined_within:<min> account_age:<days> — Bulk ban (Admins+)\n"
+            f"Flooding ({SPAM_MESSAGES}+ messages in {SPAM_WINDOW:g}s) is muted automatically for {SPAM_MUTE_MINUTES} minutes"
         ),
         inline=False
     )
@@ -329,7 +1169,8 @@ async def server_rules_cmd(interaction: discord.Interaction):
         name="🔧 Role Management Commands",
         value=(
             "/promote member:@User — Promote to next higher role (Admins+)\n"
-            "/demote member:@User — Demote to next lower role (Admins+)"
+            "/demote member:@User — Demote to next lower role (Admins+)\n"
+            "/masspromote, /massdemote members:<ids> — Move many members at once (Admins+)"
         ),
         inline=False
     )
@@ -337,11 +1178,11 @@ async def server_rules_cmd(interaction: discord.Interaction):
     embed.add_field(
         name="📝 Offline Utility Commands (Mods+)",
         value=(
-            "/record text:<text> — Save a record\n"
-            "/print — Show last saved record\n"
-            "/repeat — Toggle repeating last record in channel\n"
-            "/stop — Stop repeating last record\n"
-            "/refresh — Clear record and stop repeat"
+            "/record text:<text> scope:<channel|server> — Save a record\n"
+            "/print — Show the record for this channel\n"
+            "/repeat every:<n> min_interval:<seconds> — Toggle repeating the record in this channel\n"
+            "/stop all_channels:<bool> — Stop repeating here (or everywhere)\n"
+            "/refresh scope:<channel|server> — Clear this channel's record and stop repeat, or clear the server record"
         ),
         inline=False
     )
@@ -359,7 +1200,8 @@ async def server_rules_cmd(interaction: discord.Interaction):
         name="⚙️ Owner-only Commands",
         value=(
             "/allowchannel — Allow current channel for commands\n"
-            "/access server_id:<id> — Allow server ID for cross-server access"
+            "/access server_id:<id> — Allow server ID for cross-server access\n"
+            "/stats — Command latency and error stats"
         ),
         inline=False
     )
@@ -368,6 +1210,7 @@ async def server_rules_cmd(interaction: discord.Interaction):
         name="ℹ️ Info Commands (Mods+)",
         value=(
             "/server_rules — Show this rules & commands list\n"
+            "/cases user:@User moderator:@User action:<type> days:<n> — Search moderation cases\n"
             "/about — About Akane bot"
         ),
         inline=False
@@ -386,47 +1229,335 @@ async def server_rules_cmd(interaction: discord.Interaction):
     )
 
     embed.set_footer(text="Stay respectful and enjoy chatting with Akane 💜")
-    await interaction.response.send_message(embed=embed)
+    await reply(interaction, embed=embed)
 
 # --- About command (GLOBAL) ---
 @bot.tree.command(name="about", description="Learn about Akane")
+@tracked
 async def about_cmd(interaction: discord.Interaction):
     embed = discord.Embed(title="Akane Bot", description="Hello! I am Akane, your friendly moderation and utility bot. 💜", color=discord.Color.purple())
     embed.add_field(name="Owner", value=f"<@{OWNER_ID}>", inline=True)
     embed.add_field(name="Commands", value="Moderation, Role Management, Offline Utility, Sleep, Info, and Owner commands.", inline=False)
     embed.set_footer(text="Made with love ❤️")
-    await interaction.response.send_message(embed=embed)
+    await reply(interaction, embed=embed)
+
+# --- Case search (Mods+) ---
+
+CASES_PAGE_SIZE = 10
+CASE_REASON_LIMIT = 80  # ~180 chars per case keeps a full page under Discord's 2000
+MESSAGE_LIMIT = 2000
+CASE_ACTIONS = Literal["kick", "ban", "unban", "mute", "unmute", "promote", "demote", "automute"]
+
+def format_case(row):
+    case_id, action, target_id, moderator_id, reason, created = row
+    line = f"`#{case_id}` **{action}** <@{target_id}> by <@{moderator_id}> · <t:{int(created)}:R>"
+    if not reason:
+        return line
+    reason = " ".join(reason.split())
+    if len(reason) > CASE_REASON_LIMIT:
+        reason = reason[:CASE_REASON_LIMIT - 1] + "…"
+    return f"{line}\n  {reason}"
+
+class CasesView(discord.ui.View):
+    # Keyset pagination: each page remembers the id cursor it was loaded from
+    def __init__(self, invoker_id: int, query: dict, rows):
+        super().__init__(timeout=300)
+        self.invoker_id = invoker_id
+        self.query = query
+        self.cursors = [None]  # before_id used for each visited page
+        self.rows = rows
+        self.update_buttons()
+
+    def render(self):
+        rows = self.rows[:CASES_PAGE_SIZE]
+        header = f"📁 Cases — page {len(self.cursors)}"
+        text = header + "\n" + "\n".join(format_case(row) for row in rows)
+        return text if len(text) <= MESSAGE_LIMIT else text[:MESSAGE_LIMIT - 1] + "…"
+
+    def update_buttons(self):
+        self.previous_page.disabled = len(self.cursors) == 1
+        self.next_page.disabled = len(self.rows) <= CASES_PAGE_SIZE
+
+    async def interaction_check(self, interaction: discord.Interaction):
+        return interaction.user.id == self.invoker_id
+
+    async def load(self, interaction: discord.Interaction):
+        self.rows = await cases.search(**self.query, before_id=self.cursors[-1], limit=CASES_PAGE_SIZE + 1)
+        self.update_buttons()
+        await interaction.response.edit_message(content=self.render(), view=self)
+
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.cursors.pop()
+        await self.load(interaction)
+
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.cursors.append(self.rows[CASES_PAGE_SIZE - 1][0])
+        await self.load(interaction)
+
+@bot.tree.command(name="cases", description="Search moderation cases (Mods+)", guilds=COMMAND_GUILDS)
+@app_commands.describe(user="Cases against this user", moderator="Cases by this moderator", action="Only this action", days="Only the last N days")
+@tracked
+async def cases_cmd(interaction: discord.Interaction, user: discord.User = None, moderator: discord.User = None, action: CASE_ACTIONS = None, days: app_commands.Range[int, 1] = None):
+    if not has_required_role(interaction.user, "mod"):
+        await reply(interaction, "❌ You don't have permission to use this command.", ephemeral=True)
+        return
+    query = {
+        "guild_id": interaction.guild_id,
+        "target_id": user.id if user else None,
+        "moderator_id": moderator.id if moderator else None,
+        "action": action,
+        "since": time.time() - days * 86400 if days else None,
+    }
+    rows = await cases.search(**query, limit=CASES_PAGE_SIZE + 1)
+    if not rows:
+        await reply(interaction, "No matching cases.", ephemeral=True)
+        return
+    view = CasesView(interaction.user.id, query, rows)
+    await reply(interaction, view.render(), view=view, allowed_mentions=discord.AllowedMentions.none(), ephemeral=True)
+
+# --- Stats command (owner only) ---
+@bot.tree.command(name="stats", description="Owner only: Command latency and error stats", guilds=COMMAND_GUILDS)
+@tracked
+async def stats_cmd(interaction: discord.Interaction):
+    if interaction.user.id != OWNER_ID:
+        await reply(interaction, "❌ You don't have permission.", ephemeral=True)
+        return
+    rows = []
+    for (name, labels), hist in metrics.histograms.items():
+        if name != "bot_command_latency_seconds":
+            continue
+        command = dict(labels)["command"]
+        errors = metrics.counters.get(("bot_command_errors_total", labels), 0)
+        rows.append((hist.count, command, errors, hist.quantile(0.5), hist.quantile(0.99), hist.total / hist.count))
+    if not rows:
+        await reply(interaction, "No commands recorded yet.", ephemeral=True)
+        return
+    rows.sort(reverse=True)
+    lines = [f"{'command':<14}{'count':>7}{'errors':>7}{'p50':>7}{'p99':>7}{'avg':>7}"]
+    for count, command, errors, p50, p99, avg in rows[:25]:
+        lines.append(f"{command:<14}{count:>7}{errors:>7}{p50:>6}s{p99:>6}s{avg:>6.2f}s")
+    await reply(interaction, "📊 Command stats (p50/p99 are bucket upper bounds)\n```\n" + "\n".join(lines) + "\n```", ephemeral=True)
+
+# === Anti-spam ===
+spam_filter = SpamFilter(SPAM_MESSAGES, CHANNEL_FLOOD_MESSAGES, SPAM_WINDOW) if SPAM_MESSAGES else None
+
+async def punish_spammer(member: discord.Member, messages):
+    reason = f"Auto-mute: {SPAM_MESSAGES} messages in {SPAM_WINDOW:g}s"
+    try:
+        await apply_mute(member, discord.utils.utcnow() + timedelta(minutes=SPAM_MUTE_MINUTES), reason)
+    except discord.HTTPException as e:
+        print(f"⚠️ Auto-mute of {member} failed: {e}")
+        return
+    log_case(member.guild.id, "automute", member.id, bot.user.id, reason)
+    metrics.inc("bot_spam_mutes_total")
+    # One bulk delete per channel the burst touched
+    by_channel = {}
+    for channel_id, message_id in messages:
+        by_channel.setdefault(channel_id, []).append(discord.Object(id=message_id))
+    for channel_id, targets in by_channel.items():
+        channel = member.guild.get_channel_or_thread(channel_id)
+        if channel is None:
+            continue
+        try:
+            await channel.delete_messages(targets, reason=reason)
+        except discord.HTTPException as e:
+            print(f"⚠️ Could not delete spam in {channel}: {e}")
+
+# === Background tasks ===
+
+background_tasks = set()  # Strong references so running tasks are not garbage collected
+
+def start_background_task(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+# === Command sync ===
+# Each scope's command tree is hashed and compared with the hash stored at the
+# last successful sync, so ordinary restarts and reconnects make no sync calls.
+
+def command_fingerprint(guild=None):
+    payload = sorted((cmd.to_dict(bot.tree) for cmd in bot.tree.get_commands(guild=guild)), key=lambda c: c["name"])
+    data = json.dumps([bot.application_id, payload], sort_keys=True, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+async def sync_commands():
+    if SHARDED and bot.shard_ids and 0 not in bot.shard_ids:
+        return  # With split shard ranges only the process owning shard 0 syncs
+    fingerprints = state.get("command_sync")
+    # Guild commands for faster updates in each guild, then global commands like /about
+    scopes = [(guild.id, guild) for guild in COMMAND_GUILDS] + [("global", None)]
+    synced = failed = 0
+    for key, guild in scopes:
+        fingerprint = command_fingerprint(guild)
+        if not FORCE_SYNC and fingerprints.get(key) == fingerprint:
+            continue
+        try:
+            await bot.tree.sync(guild=guild)
+        except discord.HTTPException as e:
+            # Runs inside login(); a failed scope must not stop the bot from connecting.
+            # No fingerprint is stored, so the next start retries it.
+            print(f"⚠️ Command sync failed for {key}: {e}")
+            failed += 1
+            continue
+        state.put("command_sync", key, fingerprint)
+        synced += 1
+    if synced or failed:
+        print(f"🔄 Commands synced ({synced} scope(s), {failed} failed).")
+    else:
+        print("🔄 Commands unchanged, sync skipped.")
 
 # === Events ===
 
+def instrument_http():
+    # Count every REST call discord.py makes, by method and route
+    request = bot.http.request
+
+    async def counted_request(route, **kwargs):
+        metrics.inc("discord_rest_requests_total", method=route.method, route=route.path)
+        return await request(route, **kwargs)
+
+    bot.http.request = counted_request
+
+metrics.describe("discord_gateway_events_total", "Gateway events received, by type")
+metrics.describe("discord_rest_requests_total", "REST requests made, by method and route")
+metrics.describe("bot_commands_total", "Slash commands handled, by command")
+metrics.describe("bot_command_errors_total", "Slash commands that raised, by command")
+metrics.describe("bot_command_auto_defers_total", "Slash commands deferred automatically for running long")
+metrics.describe("bot_spam_mutes_total", "Members muted automatically for flooding")
+metrics.describe("bot_command_latency_seconds", "Slash command handler latency, by command")
+metrics.gauge("bot_outbound_queue_depth", outbound.pending, "Messages waiting in the outbound scheduler")
+metrics.gauge("bot_state_pending_writes", state.pending_writes, "State changes not yet written to disk")
+metrics.gauge("bot_member_lru_size", lambda: len(member_lru.members), "Members held in the low-memory LRU")
+metrics.gauge("bot_pending_timers", timers.pending, "Scheduled unbans and mute renewals")
+metrics.gauge("bot_case_log_pending_writes", cases.pending_writes, "Cases not yet written to the case log")
+metrics.gauge("bot_sleeping_users", sleeping_count, "Users currently marked as sleeping")
+
+@bot.event
+async def setup_hook():
+    # Start the background writer for persisted state
+    state.start()
+    start_background_task(sleep_expiry_loop())
+    start_background_task(run_timers())
+    cases.start()
+    instrument_http()
+    # Procfile restarts send SIGTERM; close cleanly so the gateway session can be resumed
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: start_background_task(bot.close()))
+    except NotImplementedError:
+        pass  # Windows
+    # Health and metrics server on this event loop
+    await webserver.start(bot)
+    # Runs once per process, unlike on_ready which fires again after every reconnect
+    await sync_commands()
+
 @bot.event
 async def on_ready():
     print(f"✅ Logged in as {bot.user}")
-    # Sync guild commands for faster updates in guild
-    await bot.tree.sync(guild=discord.Object(id=GUILD_ID))
-    # Sync global commands like /about
-    await bot.tree.sync()
-    print("🔄 Commands synced.")
+
+@bot.event
+async def on_resumed():
+    print(f"🔁 Resumed as {bot.user}")
+    # A resume after a restart starts from the role/channel snapshot only; refill
+    # the member cache in the background (REQUEST_GUILD_MEMBERS, not IDENTIFY)
+    if not LOW_MEMORY:
+        for guild in bot.guilds:
+            if not guild.chunked:
+                start_background_task(guild.chunk())
+
+@bot.event
+async def on_socket_event_type(event_type: str):
+    metrics.inc("discord_gateway_events_total", event=event_type)
+
+# Keep the role rank index in step with role and member changes
+
+@bot.event
+async def on_guild_role_create(role: discord.Role):
+    rank = ROLE_RANKS.get(role.name.lower())
+    if rank is not None and role.guild.id in guild_role_ranks:
+        guild_role_ranks[role.guild.id][role.id] = rank
+        guild_rank_roles[role.guild.id].setdefault(rank, role.id)
+
+@bot.event
+async def on_guild_role_delete(role: discord.Role):
+    ranks = guild_role_ranks.get(role.guild.id)
+    if ranks is not None and role.id in ranks:
+        # Rare; rebuilding also picks a replacement role for the rank
+        build_role_index(role.guild)
+
+@bot.event
+async def on_guild_role_update(before: discord.Role, after: discord.Role):
+    ranks = guild_role_ranks.get(after.guild.id)
+    if ranks is None:
+        return
+    if ranks.get(after.id) != ROLE_RANKS.get(after.name.lower()) or before.position != after.position:
+        build_role_index(after.guild)
+
+@bot.event
+async def on_member_update(before: discord.Member, after: discord.Member):
+    if before.roles != after.roles:
+        invalidate_member_rank(after.guild.id, after.id)
+        unpin_member(after.guild, after.id)
+
+@bot.event
+async def on_member_join(member: discord.Member):
+    if LOW_MEMORY:
+        joins = recent_joins.get(member.guild.id)
+        if joins is None:
+            joins = recent_joins[member.guild.id] = deque(maxlen=RECENT_JOIN_LIMIT)
+        joins.append(member)
+
+@bot.event
+async def on_member_remove(member: discord.Member):
+    invalidate_member_rank(member.guild.id, member.id)
+    member_lru.discard(member.guild.id, member.id)
+
+@bot.event
+async def on_guild_remove(guild: discord.Guild):
+    guild_role_ranks.pop(guild.id, None)
+    member_role_ranks.pop(guild.id, None)
 
 @bot.event
 async def on_message(message: discord.Message):
-    global last_record, repeat_enabled, repeat_channel_id
     if message.author == bot.user:
         return
 
+    # Flood check runs first so spam never reaches the sleep/repeat logic
+    if spam_filter is not None and message.guild and not message.author.bot:
+        spam = spam_filter.check(message.guild.id, message.channel.id, message.author.id, message.id, time.monotonic())
+        if spam is not None and get_highest_role_index(message.author) > PRIVILEGED_RANK:
+            start_background_task(punish_spammer(message.author, spam))
+            return
+
     # Wake up user on any message if sleeping
-    if message.author.id in sleep_start_times:
-        del sleep_start_times[message.author.id]
-        await message.channel.send(f"🌞 Welcome back, {message.author.mention}!")
+    guild_id = message.guild.id if message.guild else None
+    sleepers = sleep_start_times.get(guild_id)
+    if sleepers and message.author.id in sleepers:
+        del sleepers[message.author.id]
+        state.delete("sleep", (guild_id, message.author.id))
+        outbound.welcome_back(message.channel, message.author)
+        unpin_member(message.guild, message.author.id)
+    elif LOW_MEMORY:
+        remember_member(message.author)
 
-    # If repeat is enabled and in the repeat channel
-    if repeat_enabled and repeat_channel_id == message.channel.id:
-        if last_record:
-            await message.channel.send(last_record)
+    # If repeat is enabled in this channel and its cadence is due
+    config = repeat_configs.get(message.channel.id)
+    if config is not None and config.tick(time.monotonic()):
+        record = get_record(message.channel.id, config.guild_id)
+        if record:
+            outbound.send(message.channel, record)
 
     await bot.process_commands(message)
 
 # === Run the bot ===
-bot.run(TOKEN)
+# Guarded so benchmarks can import the handlers without connecting
+if __name__ == "__main__":
+    bot.run(TOKEN)
+    # Write out anything the background writers had not flushed yet
+    state.close()
+    cases.close()
 
 
@@ -0,0 +1,105 @@
+import asyncio
+import time
+from collections import deque
+
+# Per-channel outbound message scheduler.
+#
+# Event handlers enqueue messages and return immediately. Each channel with
+# pending messages gets one worker task that waits a short coalescing window,
+# merges what piled up (all "welcome back" greetings become one message,
+# repeated identical texts collapse into one) and sends the result while
+# pacing itself against Discord's per-channel message limit.
+
+COALESCE_WINDOW = 0.5     # seconds to wait for more messages before sending
+CHANNEL_BURST = 5         # Discord allows roughly 5 messages per 5s per channel
+CHANNEL_REFILL = 1.0      # seconds per regained send
+MESSAGE_LIMIT = 2000
+
+
+class _ChannelQueue:
+    __slots__ = ("channel", "greetings", "texts", "tokens", "updated", "task")
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.greetings = []    # mentions waiting for a merged welcome-back
+        self.texts = deque()   # plain messages in arrival order
+        self.tokens = CHANNEL_BURST
+        self.updated = time.monotonic()
+        self.task = None
+
+    def take_token_delay(self):
+        # Token bucket: returns how long to wait before the next send is allowed
+        now = time.monotonic()
+        self.tokens = min(CHANNEL_BURST, self.tokens + (now - self.updated) / CHANNEL_REFILL)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        delay = (1 - self.tokens) * CHANNEL_REFILL
+        self.tokens = 0
+        self.updated = now + delay
+        return delay
+
+
+class OutboundScheduler:
+    def __init__(self):
+        self.queues = {}  # channel_id -> _ChannelQueue
+        self.sent = 0
+        self.failed = 0
+
+    def pending(self):
+        return sum(len(q.greetings) + len(q.texts) for q in self.queues.values())
+
+    def _queue(self, channel):
+        queue = self.queues.get(channel.id)
+        if queue is None:
+            queue = self.queues[channel.id] = _ChannelQueue(channel)
+        if queue.task is None:
+            queue.task = asyncio.create_task(self._drain(queue))
+        return queue
+
+    def welcome_back(self, channel, member):
+        queue = self._queue(channel)
+        if member.mention not in queue.greetings:
+            queue.greetings.append(member.mention)
+
+    def send(self, channel, content: str):
+        self._queue(channel).texts.append(content)
+
+    def _build_messages(self, queue: _ChannelQueue):
+        messages = []
+        if queue.greetings:
+            line = ""
+            for mention in queue.greetings:
+                candidate = f"{line}, {mention}" if line else mention
+                if len(candidate) + 20 > MESSAGE_LIMIT:
+                    messages.append(f"🌞 Welcome back, {line}!")
+                    candidate = mention
+                line = candidate
+            messages.append(f"🌞 Welcome back, {line}!")
+            queue.greetings.clear()
+        previous = None
+        while queue.texts:
+            text = queue.texts.popleft()
+            if text != previous:
+                messages.append(text)
+            previous = text
+        return messages
+
+    async def _drain(self, queue: _ChannelQueue):
+        try:
+            while queue.greetings or queue.texts:
+                await asyncio.sleep(COALESCE_WINDOW)
+                for content in self._build_messages(queue):
+                    delay = queue.take_token_delay()
+                    if delay:
+                        await asyncio.sleep(delay)
+                    try:
+                        await queue.channel.send(content)
+                        self.sent += 1
+                    except Exception as e:
+                        self.failed += 1
+                        print(f"⚠️ Failed to send to channel {queue.channel.id}: {e}")
+        finally:
+            # The queue object (and its rate-limit bucket) stays around for the next burst
+            queue.task = None
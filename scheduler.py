@@ -0,0 +1,111 @@
+import asyncio
+import heapq
+import time
+
+# Persistent scheduler for timed actions (unbans, long mutes, ...).
+#
+# Timers are stored in a StateStore collection, so they survive restarts, and
+# mirrored in an in-memory min-heap. A single task sleeps until the earliest
+# deadline and runs everything due at that point as one batch. Each timer can
+# carry a key; scheduling a new timer with the same key replaces the old one,
+# which also makes cancelling by key O(1).
+#
+# Actions are run at least once: a timer is only deleted after its handler
+# returns, so a crash mid-batch repeats that batch on the next start.
+
+COLLECTION = "timers"
+BATCH_SIZE = 100     # most timers run concurrently per wake-up
+RETRY_DELAY = 60.0   # seconds before a failed action is retried
+MAX_ATTEMPTS = 5
+
+
+class TimerScheduler:
+    def __init__(self, store):
+        self.store = store
+        self.heap = []       # (due, timer_id)
+        self.keys = {}       # key -> timer_id
+        self.handlers = {}   # action -> async handler(payload)
+        self.wakeup = asyncio.Event()
+        self._next_id = 1
+
+    def load(self):
+        for timer_id, (due, action, key, payload, attempts) in self.store.get(COLLECTION).items():
+            self.heap.append((due, timer_id))
+            if key is not None:
+                self.keys[tuple(key)] = timer_id
+            self._next_id = max(self._next_id, timer_id + 1)
+        heapq.heapify(self.heap)
+
+    def pending(self):
+        return len(self.store.get(COLLECTION))
+
+    def register(self, action: str, handler):
+        self.handlers[action] = handler
+
+    def schedule(self, due: float, action: str, payload, key=None, attempts: int = 0):
+        # due is a Unix timestamp
+        if key is not None:
+            self.cancel(key)
+        timer_id = self._next_id
+        self._next_id += 1
+        self.store.put(COLLECTION, timer_id, [due, action, list(key) if key else None, payload, attempts])
+        if key is not None:
+            self.keys[key] = timer_id
+        entry = (due, timer_id)
+        heapq.heappush(self.heap, entry)
+        if self.heap[0] is entry:
+            self.wakeup.set()  # New earliest deadline
+        return timer_id
+
+    def cancel(self, key):
+        # Heap entries of cancelled timers are skipped when they come due
+        timer_id = self.keys.pop(key, None)
+        if timer_id is None:
+            return False
+        self.store.delete(COLLECTION, timer_id)
+        return True
+
+    def _pop_due(self, now: float):
+        timers = self.store.get(COLLECTION)
+        batch = []
+        while self.heap and self.heap[0][0] <= now and len(batch) < BATCH_SIZE:
+            _, timer_id = heapq.heappop(self.heap)
+            entry = timers.get(timer_id)
+            if entry is not None:
+                batch.append((timer_id, entry))
+        return batch
+
+    async def _execute(self, timer_id, entry):
+        due, action, key, payload, attempts = entry
+        key = tuple(key) if key else None
+        try:
+            await self.handlers[action](payload)
+        except Exception as e:
+            print(f"⚠️ Timer {timer_id} ({action}) failed: {e}")
+            self._finish(timer_id, key)
+            if attempts + 1 < MAX_ATTEMPTS:
+                self.schedule(time.time() + RETRY_DELAY, action, payload, key=key, attempts=attempts + 1)
+            return
+        self._finish(timer_id, key)
+
+    def _finish(self, timer_id, key):
+        # The handler may already have rescheduled under the same key
+        if key is not None and self.keys.get(key) == timer_id:
+            del self.keys[key]
+        self.store.delete(COLLECTION, timer_id)
+
+    async def run(self):
+        while True:
+            self.wakeup.clear()
+            if not self.heap:
+                await self.wakeup.wait()
+                continue
+            delay = self.heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            batch = self._pop_due(time.time())
+            await asyncio.gather(*(self._execute(timer_id, entry) for timer_id, entry in batch))
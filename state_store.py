@@ -0,0 +1,163 @@
+import asyncio
+import json
+import os
+import threading
+
+# Durable key/value state for the bot.
+#
+# State lives in named collections (dicts). Every change is appended to an
+# in-memory buffer and written to an append-only log by a background task, so
+# callers on the event loop never touch the disk. On startup the last snapshot
+# is loaded and the log is replayed on top of it. Once the log grows past
+# COMPACT_AFTER entries it is folded into a fresh snapshot.
+
+SNAPSHOT_FILE = "snapshot.json"
+LOG_FILE = "state.log"
+
+FLUSH_INTERVAL = 1.0   # seconds between background log writes
+COMPACT_AFTER = 5000   # log entries before rewriting the snapshot
+
+
+def _encode_key(key):
+    # Tuple keys (e.g. (guild_id, user_id)) are stored as JSON lists
+    return list(key) if isinstance(key, tuple) else key
+
+
+def _decode_key(key):
+    return tuple(key) if isinstance(key, list) else key
+
+
+class StateStore:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        self.log_path = os.path.join(directory, LOG_FILE)
+        self.collections = {}
+        self._pending = []
+        self._log_entries = 0
+        self._io_lock = threading.Lock()
+        self._task = None
+
+    # --- Loading ---
+
+    def load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            for name, items in snapshot.items():
+                self.collections[name] = {_decode_key(k): v for k, v in items}
+        if os.path.exists(self.log_path):
+            good_bytes = 0
+            with open(self.log_path, "rb") as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("unterminated entry")
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # torn write from a crash
+                    self._apply(entry)
+                    self._log_entries += 1
+                    good_bytes += len(line)
+            # Cut off a torn tail so new entries are not appended behind it
+            if good_bytes < os.path.getsize(self.log_path):
+                with open(self.log_path, "r+b") as f:
+                    f.truncate(good_bytes)
+                    f.flush()
+                    os.fsync(f.fileno())
+        return self.collections
+
+    def pending_writes(self):
+        return len(self._pending)
+
+    def get(self, name: str):
+        return self.collections.setdefault(name, {})
+
+    # --- Mutations (cheap, never block on disk) ---
+
+    def put(self, name: str, key, value):
+        self._record(["set", name, _encode_key(key), value])
+
+    def delete(self, name: str, key):
+        self._record(["del", name, _encode_key(key)])
+
+    def clear(self, name: str):
+        self._record(["clear", name])
+
+    def _record(self, entry):
+        self._apply(entry)
+        self._pending.append(entry)
+
+    def _apply(self, entry):
+        op, name = entry[0], entry[1]
+        collection = self.collections.setdefault(name, {})
+        if op == "set":
+            collection[_decode_key(entry[2])] = entry[3]
+        elif op == "del":
+            collection.pop(_decode_key(entry[2]), None)
+        elif op == "clear":
+            collection.clear()
+
+    # --- Background writer ---
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        self._log_entries += len(batch)
+        if self._log_entries >= COMPACT_AFTER:
+            snapshot = self._snapshot_data()
+            self._log_entries = 0
+            await asyncio.to_thread(self._write_snapshot, snapshot, batch)
+        else:
+            await asyncio.to_thread(self._append_log, batch)
+
+    def close(self):
+        # Synchronous final flush, used after the event loop has stopped
+        if self._task is not None:
+            self._task.cancel()
+        if self._pending:
+            batch, self._pending = self._pending, []
+            self._append_log(batch)
+
+    def _snapshot_data(self):
+        return {
+            name: [[_encode_key(k), v] for k, v in collection.items()]
+            for name, collection in self.collections.items()
+            if collection  # cleared collections are dropped from the snapshot
+        }
+
+    def _append_log(self, batch):
+        with self._io_lock:
+            self._write_log(batch)
+
+    def _write_log(self, batch):
+        data = "".join(json.dumps(entry, separators=(",", ":")) + "\n" for entry in batch)
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _write_snapshot(self, snapshot, batch):
+        tmp_path = self.snapshot_path + ".tmp"
+        with self._io_lock:
+            # Log the batch first: if we crash before the log is emptied below,
+            # replaying the whole log over the new snapshot gives the same state
+            self._write_log(batch)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            # The snapshot already contains everything that was in the log
+            os.truncate(self.log_path, 0)
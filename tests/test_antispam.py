@@ -0,0 +1,36 @@
+from antispam import SpamFilter
+
+
+def test_triggers_on_the_nth_message_within_the_window():
+    spam = SpamFilter(user_limit=6, channel_limit=0, window=5.0)
+    results = [spam.check(1, 10, 7, i, i * 0.5) for i in range(6)]
+    assert results[:5] == [None] * 5
+    assert results[5] == [(10, i) for i in range(6)]
+
+
+def test_slow_sender_never_triggers():
+    spam = SpamFilter(user_limit=6, channel_limit=0, window=5.0)
+    assert all(spam.check(1, 10, 7, i, i * 1.5) is None for i in range(30))
+
+
+def test_busy_channel_does_not_lower_the_limit_by_default():
+    spam = SpamFilter(user_limit=6, channel_limit=0, window=5.0)
+    for user_id in range(25):
+        spam.check(1, 10, 100 + user_id, user_id, user_id * 0.1)
+    assert all(spam.check(1, 10, 7, 50 + i, 2.5 + i) is None for i in range(3))
+
+
+def test_flood_mode_halves_the_limit_when_enabled():
+    spam = SpamFilter(user_limit=6, channel_limit=25, window=5.0)
+    for user_id in range(25):
+        spam.check(1, 10, 100 + user_id, user_id, user_id * 0.1)
+    results = [spam.check(1, 10, 7, 50 + i, 2.5 + i * 0.5) for i in range(3)]
+    assert results[:2] == [None, None]
+    assert results[2] is not None
+
+
+def test_idle_users_are_evicted():
+    spam = SpamFilter(user_limit=6, channel_limit=0, window=5.0)
+    spam.check(1, 10, 7, 1, 0.0)
+    spam.check(1, 10, 8, 2, 100.0)
+    assert list(spam.users) == [(1, 8)]
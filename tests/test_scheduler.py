@@ -0,0 +1,102 @@
+import asyncio
+import time
+
+import scheduler
+from scheduler import TimerScheduler
+from state_store import StateStore
+
+
+def reopen(directory):
+    store = StateStore(directory)
+    store.load()
+    timers = TimerScheduler(store)
+    timers.load()
+    return store, timers
+
+
+def run_due(timers, now):
+    async def run():
+        batch = timers._pop_due(now)
+        await asyncio.gather(*(timers._execute(timer_id, entry) for timer_id, entry in batch))
+        return len(batch)
+    return asyncio.run(run())
+
+
+def test_timers_survive_restart(tmp_path):
+    store, timers = reopen(tmp_path)
+    timers.schedule(100.0, "unban", {"user_id": 1}, key=("ban", 1, 1))
+    timers.schedule(200.0, "unban", {"user_id": 2})
+    store.close()
+
+    store, timers = reopen(tmp_path)
+    assert timers.pending() == 2
+    ran = []
+
+    async def unban(payload):
+        ran.append(payload["user_id"])
+
+    timers.register("unban", unban)
+    assert run_due(timers, 150.0) == 1
+    assert ran == [1]
+    # Ids keep increasing after a reload, so a new timer never overwrites an old one
+    highest = max(store.get(scheduler.COLLECTION))
+    assert timers.schedule(300.0, "unban", {"user_id": 3}) > highest
+    store.close()
+
+    store, timers = reopen(tmp_path)
+    assert timers.pending() == 2
+    assert ("ban", 1, 1) not in timers.keys
+
+
+def test_same_key_replaces_timer(tmp_path):
+    store, timers = reopen(tmp_path)
+    ran = []
+
+    async def mute(payload):
+        ran.append(payload)
+
+    timers.register("mute", mute)
+    timers.schedule(100.0, "mute", "first", key=("mute", 1, 1))
+    timers.schedule(120.0, "mute", "second", key=("mute", 1, 1))
+    assert timers.pending() == 1
+
+    assert run_due(timers, 200.0) == 1
+    assert ran == ["second"]
+    assert timers.pending() == 0
+    assert timers.keys == {}
+
+
+def test_cancel_removes_timer(tmp_path):
+    store, timers = reopen(tmp_path)
+    timers.schedule(100.0, "unban", {}, key=("ban", 1, 1))
+
+    assert timers.cancel(("ban", 1, 1))
+    assert not timers.cancel(("ban", 1, 1))
+    assert timers.pending() == 0
+    assert run_due(timers, 200.0) == 0
+
+
+def test_failed_action_is_retried_then_dropped(tmp_path):
+    store, timers = reopen(tmp_path)
+    calls = []
+
+    async def flaky(payload):
+        calls.append(payload)
+        raise RuntimeError("Discord is down")
+
+    timers.register("unban", flaky)
+    timers.schedule(100.0, "unban", "payload", key=("ban", 1, 1))
+
+    due = 100.0
+    for attempt in range(1, scheduler.MAX_ATTEMPTS):
+        failed_at = time.time()
+        assert run_due(timers, due) == 1
+        (due, action, key, payload, attempts), = store.get(scheduler.COLLECTION).values()
+        assert attempts == attempt
+        assert key == ["ban", 1, 1]
+        assert due >= failed_at + scheduler.RETRY_DELAY
+
+    assert run_due(timers, due) == 1
+    assert len(calls) == scheduler.MAX_ATTEMPTS
+    assert timers.pending() == 0
+    assert timers.keys == {}
@@ -0,0 +1,123 @@
+import asyncio
+import os
+
+import pytest
+
+import state_store
+from state_store import StateStore
+
+
+def reopen(directory):
+    store = StateStore(directory)
+    store.load()
+    return store
+
+
+def test_log_replay_restores_writes(tmp_path):
+    store = reopen(tmp_path)
+    store.put("sleep", (1, 2), 100.0)
+    store.put("sleep", (1, 3), 200.0)
+    store.delete("sleep", (1, 3))
+    store.put("allowed_servers", 7, True)
+    store.close()
+
+    store = reopen(tmp_path)
+    assert store.get("sleep") == {(1, 2): 100.0}
+    assert store.get("allowed_servers") == {7: True}
+
+
+def test_clear_is_replayed(tmp_path):
+    store = reopen(tmp_path)
+    store.put("meta", "a", 1)
+    store.clear("meta")
+    store.close()
+
+    assert reopen(tmp_path).get("meta") == {}
+
+
+def test_torn_tail_is_truncated_and_later_writes_survive(tmp_path):
+    store = reopen(tmp_path)
+    store.put("sleep", (1, 2), 1)
+    store.close()
+    with open(os.path.join(tmp_path, state_store.LOG_FILE), "a", encoding="utf-8") as f:
+        f.write('["set","sleep",[1,3')  # crash mid-write
+
+    store = reopen(tmp_path)
+    assert store.get("sleep") == {(1, 2): 1}
+    store.put("sleep", (1, 4), 4)
+    store.put("sleep", (1, 5), 5)
+    store.close()
+
+    assert reopen(tmp_path).get("sleep") == {(1, 2): 1, (1, 4): 4, (1, 5): 5}
+
+
+def test_unterminated_last_entry_is_dropped(tmp_path):
+    store = reopen(tmp_path)
+    store.put("sleep", (1, 2), 1)
+    store.close()
+    with open(os.path.join(tmp_path, state_store.LOG_FILE), "a", encoding="utf-8") as f:
+        f.write('["set","sleep",[1,3],3]')  # newline never made it to disk
+
+    store = reopen(tmp_path)
+    store.put("sleep", (1, 4), 4)
+    store.close()
+
+    assert reopen(tmp_path).get("sleep") == {(1, 2): 1, (1, 4): 4}
+
+
+def test_compaction_writes_snapshot_and_empties_log(tmp_path, monkeypatch):
+    monkeypatch.setattr(state_store, "COMPACT_AFTER", 10)
+    store = reopen(tmp_path)
+    for i in range(12):
+        store.put("records", i, f"text {i}")
+    store.delete("records", 0)
+    asyncio.run(store.flush())
+
+    assert os.path.getsize(os.path.join(tmp_path, state_store.LOG_FILE)) == 0
+    assert os.path.exists(os.path.join(tmp_path, state_store.SNAPSHOT_FILE))
+
+    store.put("records", 99, "after compaction")
+    store.close()
+    records = reopen(tmp_path).get("records")
+    assert 0 not in records
+    assert records[11] == "text 11"
+    assert records[99] == "after compaction"
+
+
+def test_crash_before_log_truncation_keeps_newer_writes(tmp_path, monkeypatch):
+    monkeypatch.setattr(state_store, "COMPACT_AFTER", 3)
+    store = reopen(tmp_path)
+    store.put("records", 1, "old")
+    asyncio.run(store.flush())
+    store.put("records", 1, "new")
+    store.put("records", 2, "two")
+
+    def crash(path, length):
+        raise OSError("crashed after the snapshot was replaced")
+
+    monkeypatch.setattr(state_store.os, "truncate", crash)
+    with pytest.raises(OSError):
+        asyncio.run(store.flush())
+    monkeypatch.undo()
+
+    assert reopen(tmp_path).get("records") == {1: "new", 2: "two"}
+
+
+def test_flush_appends_without_compacting(tmp_path):
+    store = reopen(tmp_path)
+    store.put("records", 1, "one")
+    asyncio.run(store.flush())
+
+    assert store.pending_writes() == 0
+    assert not os.path.exists(os.path.join(tmp_path, state_store.SNAPSHOT_FILE))
+    assert reopen(tmp_path).get("records") == {1: "one"}
+
+
+def test_cleared_collection_is_dropped_from_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(state_store, "COMPACT_AFTER", 1)
+    store = reopen(tmp_path)
+    store.put("meta", "last_record", "hello")
+    store.clear("meta")
+    asyncio.run(store.flush())
+
+    assert "meta" not in reopen(tmp_path).collections
@@ -1,17 +1,99 @@
-from flask import Flask
-import threading
+import asyncio
+import json
+import math
 import os
+import time
 
-app = Flask(__name__)
+import discord
+from aiohttp import web
 
-@app.route("/")
-def home():
-    return "Bot is alive!"
+import metrics
 
-def run_web():
-    port = int(os.environ.get("PORT", 8080))
-    app.run(host="0.0.0.0", port=port)
+# Keep-alive / health server running on the bot's own event loop.
+#
+# /         "Bot is alive!" with 200 while healthy, 503 otherwise (uptime probes)
+# /health   JSON liveness details
+# /metrics  Prometheus text format
+
+LAG_INTERVAL = 1.0     # seconds between event loop lag samples
+MAX_LOOP_LAG = 2.0     # seconds of lag before we report unhealthy
+MAX_LATENCY = 10.0     # seconds of heartbeat latency before we report unhealthy
+
+loop_lag = 0.0
+_runner = None
+_lag_task = None
+
+
+async def _measure_loop_lag():
+    global loop_lag
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(LAG_INTERVAL)
+        loop_lag = max(0.0, time.perf_counter() - started - LAG_INTERVAL)
+
+
+def _is_live(latency: float):
+    return not math.isnan(latency) and not math.isinf(latency)
+
+
+def health(bot):
+    data = {}
+    if isinstance(bot, discord.AutoShardedClient):
+        # AutoShardedBot never sets bot.ws; every shard has its own connection
+        shards = bot.shards
+        live = {shard_id: not shard.is_closed() and _is_live(shard.latency) for shard_id, shard in shards.items()}
+        connected = bool(shards) and all(live.values()) and not bot.is_closed()
+        latency = max((shard.latency for shard in shards.values()), default=float("inf"))
+        data["shards"] = {
+            str(shard_id): {"connected": live[shard_id], "heartbeat_latency": shard.latency if live[shard_id] else None}
+            for shard_id, shard in shards.items()
+        }
+    else:
+        latency = bot.latency
+        connected = bot.ws is not None and not bot.is_closed() and _is_live(latency)
+    healthy = connected and bot.is_ready() and latency < MAX_LATENCY and loop_lag < MAX_LOOP_LAG
+    return {
+        "healthy": healthy,
+        "gateway_connected": connected,
+        "ready": bot.is_ready(),
+        "heartbeat_latency": latency if connected else None,
+        "loop_lag": round(loop_lag, 4),
+        "guilds": len(bot.guilds),
+        **data,
+    }
 
-def start():
-    threading.Thread(target=run_web, daemon=True).start()
+
+def _make_app(bot):
+    app = web.Application()
+
+    async def home(request):
+        if health(bot)["healthy"]:
+            return web.Response(text="Bot is alive!")
+        return web.Response(text="Bot is unhealthy!", status=503)
+
+    async def health_route(request):
+        data = health(bot)
+        return web.Response(text=json.dumps(data), content_type="application/json", status=200 if data["healthy"] else 503)
+
+    async def metrics_route(request):
+        return web.Response(text=metrics.render(), content_type="text/plain")
+
+    app.router.add_get("/", home)
+    app.router.add_get("/health", health_route)
+    app.router.add_get("/metrics", metrics_route)
+    return app
+
+
+async def start(bot):
+    global _runner, _lag_task
+    if _runner is not None:
+        return
+    metrics.gauge("bot_loop_lag_seconds", lambda: loop_lag, "Event loop lag measured by a sleeping task")
+    metrics.gauge("bot_heartbeat_latency_seconds", lambda: bot.latency, "Gateway heartbeat latency")
+    metrics.gauge("bot_guilds", lambda: len(bot.guilds), "Guilds in cache")
+    port = int(os.environ.get("PORT", 8080))
+    _runner = web.AppRunner(_make_app(bot), access_log=None)
+    await _runner.setup()
+    await web.TCPSite(_runner, "0.0.0.0", port).start()
+    _lag_task = asyncio.create_task(_measure_loop_lag())
 